@@ -0,0 +1,469 @@
+"""
+genai - a single command line entry point for the hello, stream, chat and tool-loop examples
+
+    alias genai="python path/to/07_genai_cli.py"
+
+    genai hello                                 # chapter 1 hello world
+    genai --provider anthropic hello            # same thing, but claude
+    genai stream "Write a sonnet about recursion in programming."
+    genai chat                                  # chapter 2 chatbot
+    genai tools                                 # chapter 3 tool calling loop
+
+    genai serve &                               # keep a warm client around
+    genai --warm hello                          # ...and reuse it across invocations
+
+    genai bench-startup                         # measure time-to-prompt with -X importtime
+
+Only the standard library is imported at the top of this file. The provider
+SDKs (openai, anthropic) are imported the first time a client is actually needed,
+so `genai chat` shows its prompt before paying for `import openai`.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+DEFAULT_MODELS = {
+    "openai": "gpt-4o",
+    "anthropic": "claude-3-haiku-20240307",
+}
+
+SOCKET_PATH = os.environ.get(
+    "GENAI_SOCKET", os.path.join(os.path.expanduser("~"), ".genai.sock")
+)
+
+# one client per provider per process, built on first use
+_clients = {}
+
+
+def get_client(provider: str):
+    client = _clients.get(provider)
+    if client is not None:
+        return client
+
+    if provider == "openai":
+        from openai import OpenAI
+
+        client = OpenAI()
+    elif provider == "anthropic":
+        from anthropic import Anthropic
+
+        client = Anthropic()
+    else:
+        raise ValueError(f"Unknown provider: {provider}")
+
+    _clients[provider] = client
+    return client
+
+
+def complete(provider: str, model: str, prompt: str) -> str:
+    client = get_client(provider)
+    if provider == "anthropic":
+        completion = client.messages.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=1000,
+        )
+        return completion.content[0].text
+
+    completion = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt},
+        ],
+    )
+    return completion.choices[0].message.content
+
+
+def stream(provider: str, model: str, prompt: str):
+    client = get_client(provider)
+    if provider == "anthropic":
+        with client.messages.stream(
+            model=model,
+            max_tokens=1024,
+            messages=[{"role": "user", "content": prompt}],
+        ) as s:
+            yield from s.text_stream
+        return
+
+    chunks = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt},
+        ],
+        stream=True,
+    )
+    for chunk in chunks:
+        if chunk.choices and chunk.choices[0].delta.content is not None:
+            yield chunk.choices[0].delta.content
+
+
+# ---------------------------------------------------------------------------
+# warm client daemon
+#
+# `genai serve` keeps a process (and its already-imported SDKs and pooled
+# connections) alive on a unix socket. `genai --warm hello` hands the request
+# to it instead of importing anything itself, and falls back to running
+# locally if the daemon isn't there.
+# ---------------------------------------------------------------------------
+
+
+def _authkey() -> bytes:
+    # the socket is created 0600, the key just keeps stray connections out
+    return os.environ.get("GENAI_AUTHKEY", f"genai-{os.getuid()}").encode()
+
+
+def _daemon_running() -> bool:
+    import socket
+
+    with socket.socket(socket.AF_UNIX) as sock:
+        try:
+            sock.connect(SOCKET_PATH)
+        except OSError:
+            return False
+    return True
+
+
+def serve():
+    from multiprocessing.connection import Listener
+
+    if os.path.exists(SOCKET_PATH):
+        if _daemon_running():
+            raise SystemExit(f"genai: a daemon is already serving on {SOCKET_PATH}")
+        # left behind by a daemon that didn't shut down cleanly
+        os.unlink(SOCKET_PATH)
+
+    old_umask = os.umask(0o177)
+    try:
+        listener = Listener(SOCKET_PATH, family="AF_UNIX", authkey=_authkey())
+    finally:
+        os.umask(old_umask)
+
+    # pay for the imports up front so the first request is warm too
+    for provider in DEFAULT_MODELS:
+        try:
+            get_client(provider)
+        except Exception as e:
+            print(f"not warming {provider}: {e}", file=sys.stderr)
+
+    print(f"genai: serving warm clients on {SOCKET_PATH}", file=sys.stderr)
+    with listener:
+        while True:
+            try:
+                conn = listener.accept()
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                print(f"genai: rejected connection: {e}", file=sys.stderr)
+                continue
+
+            with conn:
+                try:
+                    mode, provider, model, prompt = conn.recv()
+                    if mode == "stream":
+                        for text in stream(provider, model, prompt):
+                            conn.send(("chunk", text))
+                    else:
+                        conn.send(("chunk", complete(provider, model, prompt)))
+                    conn.send(("done", None))
+                except Exception as e:
+                    try:
+                        conn.send(("error", f"{type(e).__name__}: {e}"))
+                    except OSError:
+                        # the client hung up, nobody to tell
+                        pass
+
+
+def run_warm(mode: str, provider: str, model: str, prompt: str) -> bool:
+    """
+    returns False if there's no daemon to talk to, so the caller can run locally
+    """
+    if not os.path.exists(SOCKET_PATH):
+        return False
+
+    from multiprocessing.connection import Client
+
+    try:
+        conn = Client(SOCKET_PATH, family="AF_UNIX", authkey=_authkey())
+    except OSError:
+        return False
+
+    with conn:
+        conn.send((mode, provider, model, prompt))
+        while True:
+            kind, payload = conn.recv()
+            if kind == "chunk":
+                print(payload, end="", flush=True)
+            elif kind == "error":
+                raise RuntimeError(payload)
+            else:
+                print()
+                return True
+
+
+# ---------------------------------------------------------------------------
+# modes
+# ---------------------------------------------------------------------------
+
+
+def run_hello(args):
+    prompt = args.prompt or "Write a haiku about recursion in programming."
+    if args.warm and run_warm("hello", args.provider, args.model, prompt):
+        return
+    print(complete(args.provider, args.model, prompt))
+
+
+def run_stream(args):
+    prompt = args.prompt or "Write a sonnet about recursion in programming."
+    if args.warm and run_warm("stream", args.provider, args.model, prompt):
+        return
+    for text in stream(args.provider, args.model, prompt):
+        print(text, end="", flush=True)
+    print()
+
+
+def read_user_input():
+    print("\n------User------\n\n> ", end="", flush=True)
+    try:
+        user_input = input()
+    except EOFError:
+        print()
+        return None
+    if user_input == "exit":
+        return None
+    return user_input
+
+
+def run_chat(args):
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+
+    # the prompt goes out before we import or build anything
+    while (user_input := read_user_input()) is not None:
+        messages.append({"role": "user", "content": user_input})
+
+        if args.provider == "anthropic":
+            completion = get_client("anthropic").messages.create(
+                model=args.model,
+                system=messages[0]["content"],
+                messages=messages[1:],
+                max_tokens=1000,
+            )
+            content = completion.content[0].text
+        else:
+            completion = get_client("openai").chat.completions.create(
+                model=args.model,
+                messages=messages,
+            )
+            content = completion.choices[0].message.content
+
+        messages.append({"role": "assistant", "content": content})
+        print("\n-----Assistant-----\n", content)
+
+
+def get_estimated_delivery_date(tracking_number: str) -> str:
+    """
+    get the estimated delivery date for a package
+    """
+    from datetime import datetime, timedelta
+    from random import randint
+
+    return datetime.now() + timedelta(days=randint(1, 14))
+
+
+openai_functions = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_estimated_delivery_date",
+            "description": "get the estimated delivery date for a package",
+            "parameters": {
+                "type": "object",
+                "properties": {"tracking_number": {"type": "string"}},
+                "required": ["tracking_number"],
+            },
+        },
+    }
+]
+
+
+def run_tools(args):
+    if args.provider != "openai":
+        raise SystemExit("genai tools only supports --provider openai for now")
+
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+
+    user_input = read_user_input()
+    if user_input is None:
+        return
+    messages.append({"role": "user", "content": user_input})
+
+    while True:
+        resp = get_client("openai").chat.completions.create(
+            model=args.model,
+            messages=messages,
+            tools=openai_functions,
+        )
+        messages.append(resp.choices[0].message.model_dump())
+
+        if not resp.choices[0].message.tool_calls:
+            print("\n\n------ASSISTANT-----\n\n")
+            print(json.dumps(messages[-1]["content"], indent=2))
+            user_input = read_user_input()
+            if user_input is None:
+                break
+            messages.append({"role": "user", "content": user_input})
+            continue
+
+        for tool_call in resp.choices[0].message.tool_calls:
+            if tool_call.function.name == "get_estimated_delivery_date":
+                tool_args = json.loads(tool_call.function.arguments)
+                print("\n\n------ASSISTANT (tools) -----\n\n")
+                print(f"get_estimated_delivery_date({json.dumps(tool_args, indent=2)})")
+                delivery_date = get_estimated_delivery_date(tool_args["tracking_number"])
+                print(f"\n=> {delivery_date}")
+                messages.append(
+                    {
+                        "role": "tool",
+                        "tool_call_id": tool_call.id,
+                        "content": delivery_date.isoformat(),
+                    }
+                )
+            else:
+                raise ValueError(f"Unknown tool call: {tool_call.function.name}")
+
+
+# ---------------------------------------------------------------------------
+# startup benchmark
+# ---------------------------------------------------------------------------
+
+
+def time_to_prompt(cmd, env) -> tuple:
+    """
+    start `cmd`, wait for the "> " prompt on stdout, then close stdin.
+
+    returns (seconds until the prompt showed up, stderr output)
+    """
+    import subprocess
+    import tempfile
+    import time
+
+    # -X importtime writes a lot to stderr, so send it to a file rather than
+    # a pipe that nobody reads until the prompt shows up
+    with tempfile.TemporaryFile() as stderr_file:
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            env=env,
+        )
+        seen = b""
+        while not seen.endswith(b"> "):
+            byte = proc.stdout.read(1)
+            if not byte:
+                break
+            seen += byte
+        elapsed = time.perf_counter() - start
+
+        proc.communicate(input=b"")
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode()
+
+    if not seen.endswith(b"> "):
+        raise RuntimeError(f"never saw a prompt from {cmd}:\n{stderr}")
+    return elapsed, stderr
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    -X importtime lines look like
+
+        import time: self [us] | cumulative | imported package
+        import time:       161 |        161 |   _io
+
+    returns [(cumulative_us, package)] for top level imports only
+    """
+    top_level = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.startswith("  "):
+            # indented entries are nested inside another import
+            continue
+        top_level.append((int(cumulative), name.strip()))
+    return top_level
+
+
+def run_bench_startup(args):
+    from statistics import median
+
+    env = dict(os.environ)
+    # the eager baseline builds OpenAI() at import time, which wants a key
+    env.setdefault("OPENAI_API_KEY", "sk-bench-startup")
+
+    lazy_cmd = [sys.executable, "-X", "importtime", os.path.abspath(__file__), "chat"]
+    # what every solution script does today: import + build the client, then prompt
+    eager_cmd = [
+        sys.executable,
+        "-X",
+        "importtime",
+        "-c",
+        "from openai import OpenAI\n"
+        "client = OpenAI()\n"
+        "print('\\n------User------\\n\\n> ', end='', flush=True)\n"
+        "input()",
+    ]
+
+    for label, cmd in [("eager (import + build client)", eager_cmd), ("genai chat (lazy)", lazy_cmd)]:
+        timings = []
+        imports = []
+        for _ in range(args.runs):
+            elapsed, stderr = time_to_prompt(cmd, env)
+            timings.append(elapsed)
+            imports = parse_importtime(stderr)
+
+        total_import_ms = sum(us for us, _ in imports) / 1000
+        print(f"\n{label}")
+        print(f"  time to prompt: median {median(timings) * 1000:.1f}ms, "
+              f"min {min(timings) * 1000:.1f}ms over {args.runs} runs")
+        print(f"  import time:    {total_import_ms:.1f}ms across {len(imports)} top-level imports")
+        for us, name in sorted(imports, reverse=True)[:5]:
+            print(f"    {us / 1000:8.1f}ms  {name}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="genai", description=__doc__.split("\n")[1])
+    parser.add_argument("--provider", choices=sorted(DEFAULT_MODELS), default="openai")
+    parser.add_argument("--model", help="defaults to a sensible model for the provider")
+    parser.add_argument(
+        "--warm",
+        action="store_true",
+        help="send hello/stream requests to a running `genai serve` if there is one",
+    )
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    for mode, fn in [("hello", run_hello), ("stream", run_stream)]:
+        p = sub.add_parser(mode)
+        p.add_argument("prompt", nargs="?")
+        p.set_defaults(fn=fn)
+
+    sub.add_parser("chat").set_defaults(fn=run_chat)
+    sub.add_parser("tools").set_defaults(fn=run_tools)
+    sub.add_parser("serve").set_defaults(fn=lambda args: serve())
+
+    bench = sub.add_parser("bench-startup")
+    bench.add_argument("--runs", type=int, default=5)
+    bench.set_defaults(fn=run_bench_startup)
+
+    args = parser.parse_args(argv)
+    args.model = args.model or DEFAULT_MODELS[args.provider]
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
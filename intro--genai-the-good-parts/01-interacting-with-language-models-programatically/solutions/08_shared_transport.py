@@ -0,0 +1,661 @@
+"""
+one tuned, pooled http transport shared by every OpenAI and Anthropic client in the process
+
+    openai, anthropic = shared_clients()
+    openai.chat.completions.create(...)
+
+By default every `OpenAI()` / `Anthropic()` builds its own connection pool, so
+two chains or two chat sessions never reuse each other's TLS connections. Here
+we build a single httpx client with keep-alive and pool limits sized for our
+concurrency, and hand it to both SDKs via `http_client=`. The async client
+also speaks HTTP/2, so many requests share one connection.
+
+The transport also keeps a few numbers around so you can tell when the pool is
+too small (connections all busy, requests waiting for one) or when you're
+paying for lots of new connections (connection setup time).
+
+    python 08_shared_transport.py bench    # p99 against local HTTP/1.1 and HTTP/2 TLS mock servers
+
+HTTP/2 needs the `h2` package (`pip install 'httpx[http2]'`), if it isn't
+installed we fall back to HTTP/1.1 keep-alive.
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+import weakref
+
+import httpx
+
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE_CONNECTIONS = 32
+KEEPALIVE_EXPIRY = 30.0
+
+
+# the first of these is when the pool handed the request a connection: it's
+# either opening a new one or sending on one it was given
+_ACQUIRED_EVENTS = {
+    "connection.connect_tcp.started",
+    "http11.send_request_headers.started",
+    "http2.send_request_headers.started",
+}
+
+
+class PoolMetrics:
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        # connections with a request on them. with HTTP/2 many requests share
+        # one, so this (not in_flight) is what runs into max_connections
+        self.peak_busy_connections = 0
+        # time from handing the request to the pool to getting a connection.
+        # on asyncio that includes waiting for the event loop to get back to it
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.connects = 0
+        self.connect_seconds = 0.0
+
+    def request_started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def request_finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def connection_acquired(self, waited: float, busy: int):
+        with self._lock:
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            self.peak_busy_connections = max(self.peak_busy_connections, busy)
+
+    def connection_opened(self, seconds: float):
+        with self._lock:
+            self.connects += 1
+            self.connect_seconds += seconds
+
+    def trace_for_request(self, tls: bool, busy_connections):
+        """
+        httpcore calls `trace(event_name, info)` as it works through a request.
+        a new connection shows up as connect_tcp.started, and it's usable after
+        connect_tcp.complete (http) or start_tls.complete (https).
+
+        `busy_connections()` counts the pool's connections that aren't idle
+        """
+        ready_event = (
+            "connection.start_tls.complete" if tls else "connection.connect_tcp.complete"
+        )
+        requested_at = time.perf_counter()
+        started = {}
+
+        def trace(event_name, info):
+            if "acquired" not in started and event_name in _ACQUIRED_EVENTS:
+                started["acquired"] = True
+                self.connection_acquired(time.perf_counter() - requested_at, busy_connections())
+            if event_name == "connection.connect_tcp.started":
+                started["at"] = time.perf_counter()
+            elif event_name == ready_event and "at" in started:
+                self.connection_opened(time.perf_counter() - started.pop("at"))
+
+        return trace
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "peak_busy_connections": self.peak_busy_connections,
+                "pool_saturation": self.peak_busy_connections / self.max_connections,
+                "avg_pool_wait_ms": 1000 * self.wait_seconds / self.requests if self.requests else 0.0,
+                "max_pool_wait_ms": 1000 * self.max_wait_seconds,
+                "connections_opened": self.connects,
+                "avg_connect_ms": (
+                    1000 * self.connect_seconds / self.connects if self.connects else 0.0
+                ),
+            }
+
+
+def _busy_connections(transport):
+    # httpx keeps its httpcore pool in `_pool`, `connections` and `is_idle()` are public httpcore
+    return lambda: sum(1 for connection in transport._pool.connections if not connection.is_idle())
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    def __init__(self, metrics: PoolMetrics, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+    def handle_request(self, request):
+        tls = request.url.scheme == "https"
+        request.extensions["trace"] = self.metrics.trace_for_request(tls, _busy_connections(self))
+        self.metrics.request_started()
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            self.metrics.request_finished()
+            raise
+        # the connection stays checked out until the body is read
+        response.stream = _ReleaseOnClose(response.stream, self.metrics)
+        return response
+
+
+class _ReleaseOnClose(httpx.SyncByteStream):
+    def __init__(self, stream, metrics):
+        self._stream = stream
+        self._metrics = metrics
+        self._closed = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._metrics.request_finished()
+
+
+class InstrumentedAsyncTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, metrics: PoolMetrics, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+    async def handle_async_request(self, request):
+        tls = request.url.scheme == "https"
+        request.extensions["trace"] = _async_trace(
+            self.metrics.trace_for_request(tls, _busy_connections(self))
+        )
+        self.metrics.request_started()
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            self.metrics.request_finished()
+            raise
+        response.stream = _AsyncReleaseOnClose(response.stream, self.metrics)
+        return response
+
+
+def _async_trace(trace):
+    async def async_trace(event_name, info):
+        trace(event_name, info)
+
+    return async_trace
+
+
+class _AsyncReleaseOnClose(httpx.AsyncByteStream):
+    def __init__(self, stream, metrics):
+        self._stream = stream
+        self._metrics = metrics
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._metrics.request_finished()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _transport_kwargs(max_connections, max_keepalive_connections, keepalive_expiry, http2, verify):
+    return dict(
+        http2=http2 and _http2_available(),
+        verify=verify,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        retries=0,  # the SDKs do their own retries
+    )
+
+
+def build_http_client(
+    max_connections: int = MAX_CONNECTIONS,
+    max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry: float = KEEPALIVE_EXPIRY,
+    http2: bool = False,
+    verify=True,
+    timeout: float = 600.0,
+) -> httpx.Client:
+    """
+    HTTP/1.1 keep-alive by default: httpcore's sync HTTP/2 connection, shared
+    by many threads, now and then fails a response with a KeyError under load.
+    the async client doesn't have that problem and uses HTTP/2
+    """
+    metrics = PoolMetrics(max_connections)
+    client = httpx.Client(
+        transport=InstrumentedTransport(
+            metrics,
+            **_transport_kwargs(
+                max_connections, max_keepalive_connections, keepalive_expiry, http2, verify
+            ),
+        ),
+        timeout=httpx.Timeout(timeout, connect=5.0),
+    )
+    client.pool_metrics = metrics
+    return client
+
+
+def build_async_http_client(
+    max_connections: int = MAX_CONNECTIONS,
+    max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry: float = KEEPALIVE_EXPIRY,
+    http2: bool = True,
+    verify=True,
+    timeout: float = 600.0,
+) -> httpx.AsyncClient:
+    metrics = PoolMetrics(max_connections)
+    client = httpx.AsyncClient(
+        transport=InstrumentedAsyncTransport(
+            metrics,
+            **_transport_kwargs(
+                max_connections, max_keepalive_connections, keepalive_expiry, http2, verify
+            ),
+        ),
+        timeout=httpx.Timeout(timeout, connect=5.0),
+    )
+    client.pool_metrics = metrics
+    return client
+
+
+# one pool per process, and one per event loop for the async side (an
+# httpx.AsyncClient's connections belong to the loop that opened them)
+_shared_http_client = None
+_shared_async_http_clients = weakref.WeakKeyDictionary()
+_shared_lock = threading.Lock()
+
+
+def shared_http_client() -> httpx.Client:
+    global _shared_http_client
+    with _shared_lock:
+        if _shared_http_client is None:
+            _shared_http_client = build_http_client()
+        return _shared_http_client
+
+
+def shared_async_http_client() -> httpx.AsyncClient:
+    """
+    must be called from inside a running event loop
+    """
+    loop = asyncio.get_running_loop()
+    with _shared_lock:
+        client = _shared_async_http_clients.get(loop)
+        if client is None:
+            client = _shared_async_http_clients[loop] = build_async_http_client()
+        return client
+
+
+def shared_clients(openai_kwargs: dict = None, anthropic_kwargs: dict = None):
+    """
+    an OpenAI and an Anthropic client that share one connection pool.
+
+    connections are per-host, so the two providers don't steal each other's
+    sockets, but they do share the overall limits and metrics. api_key,
+    base_url etc. go in the kwargs for their own provider.
+    """
+    from anthropic import Anthropic
+    from openai import OpenAI
+
+    http_client = shared_http_client()
+    return (
+        OpenAI(http_client=http_client, **(openai_kwargs or {})),
+        Anthropic(http_client=http_client, **(anthropic_kwargs or {})),
+    )
+
+
+def shared_async_clients(openai_kwargs: dict = None, anthropic_kwargs: dict = None):
+    """
+    shared_clients() for asyncio, sharing this event loop's pool
+    """
+    from anthropic import AsyncAnthropic
+    from openai import AsyncOpenAI
+
+    http_client = shared_async_http_client()
+    return (
+        AsyncOpenAI(http_client=http_client, **(openai_kwargs or {})),
+        AsyncAnthropic(http_client=http_client, **(anthropic_kwargs or {})),
+    )
+
+
+# ---------------------------------------------------------------------------
+# benchmark against local TLS mock servers, one HTTP/1.1 and one HTTP/2
+# ---------------------------------------------------------------------------
+
+CHAT_COMPLETION = b"""{
+  "id": "chatcmpl-mock",
+  "object": "chat.completion",
+  "created": 0,
+  "model": "gpt-4o",
+  "choices": [
+    {
+      "index": 0,
+      "message": {"role": "assistant", "content": "Code calls on itself"},
+      "finish_reason": "stop"
+    }
+  ],
+  "usage": {"prompt_tokens": 20, "completion_tokens": 5, "total_tokens": 25}
+}"""
+
+
+def make_self_signed_cert(directory: str):
+    import os
+    import subprocess
+
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+            "-keyout", key, "-out", cert, "-days", "1",
+            "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+class MockServer:
+    """
+    a tiny HTTP/1.1 keep-alive server on asyncio: every request gets
+    CHAT_COMPLETION after `latency` seconds.
+
+    one thread for all connections, like H2MockServer. (http.server's
+    thread-per-connection ends up timing 32 threads fighting over the GIL.)
+    """
+
+    def __init__(self, cert: str, key: str, latency: float):
+        import ssl
+
+        self.latency = latency
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        # HTTP/1.1 only, so h2 clients negotiate down. H2MockServer is the HTTP/2 one
+        context.set_alpn_protocols(["http/1.1"])
+
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self._serve, "127.0.0.1", 0, ssl=context, backlog=128)
+        )
+        self.server_address = self.server.sockets[0].getsockname()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    async def _serve(self, reader, writer):
+        response = (
+            b"HTTP/1.1 200 OK\r\ncontent-type: application/json\r\n"
+            b"content-length: %d\r\n\r\n%s" % (len(CHAT_COMPLETION), CHAT_COMPLETION)
+        )
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        length = int(value)
+                await reader.readexactly(length)
+                await asyncio.sleep(self.latency)
+                writer.write(response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def shutdown(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class H2MockServer:
+    """
+    a tiny HTTP/2-only server built on `h2`: every request gets CHAT_COMPLETION
+    after `latency` seconds, and many requests share one connection.
+
+    one thread per connection, which reads frames and sends responses as they
+    come due (an SSL socket can't safely be read and written from two threads)
+    """
+
+    def __init__(self, cert: str, key: str, latency: float):
+        import socket
+        import ssl
+
+        self.latency = latency
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(cert, key)
+        self.context.set_alpn_protocols(["h2"])
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.server_address = self.listener.getsockname()
+        self._stopped = threading.Event()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while not self._stopped.is_set():
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(sock,), daemon=True).start()
+
+    def _serve(self, sock):
+        import heapq
+        import select
+
+        import h2.config
+        import h2.connection
+        import h2.events
+
+        try:
+            tls = self.context.wrap_socket(sock, server_side=True)
+        except OSError:
+            sock.close()
+            return
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        conn.initiate_connection()
+        tls.sendall(conn.data_to_send())
+        due = []  # (when, stream_id)
+
+        try:
+            while not self._stopped.is_set():
+                timeout = max(0.0, due[0][0] - time.monotonic()) if due else 1.0
+                if tls.pending() or select.select([tls], [], [], timeout)[0]:
+                    data = tls.recv(65536)
+                    if not data:
+                        return
+                    for event in conn.receive_data(data):
+                        if isinstance(event, h2.events.DataReceived):
+                            conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                        elif isinstance(event, h2.events.StreamEnded):
+                            heapq.heappush(due, (time.monotonic() + self.latency, event.stream_id))
+                        elif isinstance(event, h2.events.ConnectionTerminated):
+                            return
+
+                while due and due[0][0] <= time.monotonic():
+                    _, stream_id = heapq.heappop(due)
+                    conn.send_headers(
+                        stream_id,
+                        [
+                            (":status", "200"),
+                            ("content-type", "application/json"),
+                            ("content-length", str(len(CHAT_COMPLETION))),
+                        ],
+                    )
+                    conn.send_data(stream_id, CHAT_COMPLETION, end_stream=True)
+                tls.sendall(conn.data_to_send())
+        except OSError:
+            pass
+        finally:
+            tls.close()
+
+    def shutdown(self):
+        self._stopped.set()
+        self.listener.close()
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+async def run_sessions(make_client, sessions, calls_per_session, concurrency, close=False):
+    """
+    every "session" is a short chain of calls, like 06_assignment_chained_calls.py,
+    at most `concurrency` at a time. with close=True each session's client is
+    closed when it's done
+    """
+    latencies = []
+    limit = asyncio.Semaphore(concurrency)
+
+    async def session():
+        async with limit:
+            client = make_client()
+            try:
+                for _ in range(calls_per_session):
+                    start = time.perf_counter()
+                    await client.chat.completions.create(
+                        model="gpt-4o",
+                        messages=[{"role": "user", "content": "Write a haiku about recursion in programming."}],
+                    )
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                if close:
+                    await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(sessions)))
+    return latencies, time.perf_counter() - start
+
+
+async def bench_async(args, cert, http1_url, h2_url):
+    """
+    everything on the async clients, so HTTP/1.1 and HTTP/2 are measured the
+    same way (and HTTP/2 runs on the transport that's safe to share)
+    """
+    from openai import AsyncOpenAI
+
+    # what the solution scripts do: a new client (and pool) per chain
+    def default_client():
+        return AsyncOpenAI(api_key="sk-mock", base_url=http1_url, http_client=httpx.AsyncClient(verify=cert))
+
+    tuned = {
+        protocol: build_async_http_client(
+            max_connections=args.concurrency,
+            max_keepalive_connections=args.concurrency,
+            http2=protocol == "HTTP/2",
+            verify=cert,
+        )
+        for protocol in ("HTTP/1.1", "HTTP/2")
+    }
+    runs = [
+        ("default", "HTTP/1.1", default_client, True),
+        ("tuned", "HTTP/1.1", lambda: AsyncOpenAI(api_key="sk-mock", base_url=http1_url, http_client=tuned["HTTP/1.1"]), False),
+    ]
+    if _http2_available():
+        runs.append(
+            ("tuned", "HTTP/2", lambda: AsyncOpenAI(api_key="sk-mock", base_url=h2_url, http_client=tuned["HTTP/2"]), False)
+        )
+    else:
+        print("h2 isn't installed, skipping HTTP/2 (pip install 'httpx[http2]')")
+
+    print(
+        f"{args.sessions} sessions x {args.calls} calls, concurrency {args.concurrency}, "
+        f"{args.latency * 1000:.0f}ms server latency"
+    )
+    for label, protocol, make_client, close in runs:
+        latencies, elapsed = await run_sessions(
+            make_client, args.sessions, args.calls, args.concurrency, close=close
+        )
+        print(
+            f"{label:>8} {protocol:<9}: p50 {percentile(latencies, 50) * 1000:6.1f}ms  "
+            f"p99 {percentile(latencies, 99) * 1000:6.1f}ms  "
+            f"{len(latencies) / elapsed:7.1f} req/s"
+        )
+
+    print()
+    for protocol, client in tuned.items():
+        if protocol == "HTTP/2" and not _http2_available():
+            continue
+        print(f"tuned {protocol} pool metrics: {client.pool_metrics.snapshot()}")
+        await client.aclose()
+
+
+def _serve_mocks(cert: str, key: str, latency: float, conn):
+    """
+    runs in its own process, so the servers aren't fighting the client's event
+    loop for the GIL
+    """
+    http1_server = MockServer(cert, key, latency)
+    h2_server = H2MockServer(cert, key, latency)
+    conn.send((http1_server.server_address[1], h2_server.server_address[1]))
+    conn.recv()  # until the bench is done
+    http1_server.shutdown()
+    h2_server.shutdown()
+
+
+def bench(args):
+    import multiprocessing
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = make_self_signed_cert(tmp)
+        conn, child_conn = multiprocessing.Pipe()
+        servers = multiprocessing.Process(target=_serve_mocks, args=(cert, key, args.latency, child_conn), daemon=True)
+        servers.start()
+        try:
+            http1_port, h2_port = conn.recv()
+            asyncio.run(
+                bench_async(
+                    args,
+                    cert,
+                    f"https://127.0.0.1:{http1_port}/v1",
+                    f"https://127.0.0.1:{h2_port}/v1",
+                )
+            )
+        finally:
+            conn.send("stop")
+            servers.join(5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="shared, tuned http transport for LLM clients")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("bench", help="compare default vs tuned clients against local TLS mocks")
+    b.add_argument("--sessions", type=int, default=200)
+    b.add_argument("--calls", type=int, default=3, help="calls per session")
+    b.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="sessions at once. client and servers share this machine's CPUs, so past "
+        "what they can keep up with you're measuring the CPU queue, not the pool",
+    )
+    b.add_argument("--latency", type=float, default=0.05, help="mock server latency in seconds")
+    b.set_defaults(fn=bench)
+    args = parser.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+pick the few-shot examples that matter for *this* question, instead of sending all of them
+
+08-whats-your-name-few-shot.py hard-codes every example pair into every request.
+That's fine for six examples, but once you have thousands you can only afford to
+send a handful. Here we:
+
+- embed every example's user message with a tiny local hashing embedding
+  (no API calls, no model download, same vector on every machine)
+- keep the vectors in a NumPy matrix (optionally memory-mapped from disk)
+- for each incoming question, send only the top-k most similar pairs
+
+    python 09-few-shot-selector.py                     # run it against gpt-4o
+    python 09-few-shot-selector.py ask "What is the best pizza in Chicago?"
+    python 09-few-shot-selector.py bench               # selection latency at 10k and 1M examples
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+import zlib
+
+import numpy as np
+
+DIM = 128
+SEARCH_BLOCK = 1 << 18  # rows scored at a time, keeps the score matrix small
+
+_token_re = re.compile(r"\w+")
+
+
+def _features(text: str):
+    tokens = _token_re.findall(text.lower())
+    yield from tokens
+    # bigrams so "new york" and "york new" don't look identical
+    for a, b in zip(tokens, tokens[1:]):
+        yield f"{a} {b}"
+
+
+def embed(texts, dim: int = DIM) -> np.ndarray:
+    """
+    feature hashing: every word / word pair is hashed to a bucket and a sign.
+
+    crc32 rather than hash() so the vectors are stable across processes
+    (hash() is salted per run), which keeps selection deterministic.
+    """
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for feature in _features(text):
+            h = zlib.crc32(feature.encode())
+            vectors[row, h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+class FewShotIndex:
+    def __init__(self, examples=None, vectors=None, dim: int = DIM):
+        # examples are (user, assistant) pairs, vectors[i] embeds examples[i][0]
+        self.dim = dim
+        self.examples = list(examples or [])
+        self.vectors = (
+            vectors if vectors is not None else np.zeros((0, dim), dtype=np.float32)
+        )
+
+    def __len__(self):
+        return len(self.examples)
+
+    def add(self, pairs):
+        pairs = list(pairs)
+        new_vectors = embed([user for user, _ in pairs], self.dim)
+        self.examples.extend(pairs)
+        self.vectors = np.concatenate([np.asarray(self.vectors), new_vectors])
+
+    def search(self, query_vectors: np.ndarray, k: int):
+        """
+        batched top-k by cosine similarity (the vectors are already unit length,
+        so that's just a dot product).
+
+        returns (indices, scores), both shaped (n_queries, k). ties are broken by
+        the lower index, so the same question always gets the same examples.
+        """
+        n = len(self.vectors)
+        k = max(0, min(k, n))
+        queries = np.atleast_2d(query_vectors).astype(np.float32, copy=False)
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+        best_idx = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+
+        for start in range(0, n, SEARCH_BLOCK):
+            block = np.asarray(self.vectors[start:start + SEARCH_BLOCK])
+            scores = queries @ block.T
+            part = _block_candidates(scores, min(k, scores.shape[1]))
+            best_idx = np.concatenate([best_idx, part + start], axis=1)
+            best_scores = np.concatenate(
+                [best_scores, np.take_along_axis(scores, part, axis=1)], axis=1
+            )
+            if best_idx.shape[1] > k:
+                best_idx, best_scores = _top_k(best_idx, best_scores, k)
+
+        return _top_k(best_idx, best_scores, k)
+
+    def select(self, question: str, k: int = 3):
+        indices, _ = self.search(embed([question], self.dim), k)
+        return [self.examples[i] for i in indices[0]]
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), np.asarray(self.vectors))
+        with open(os.path.join(path, "examples.jsonl"), "w") as f:
+            for user, assistant in self.examples:
+                f.write(json.dumps([user, assistant]) + "\n")
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        """
+        with mmap=True the vectors stay on disk and the OS pages in what the
+        search touches, so a 1M-example index opens instantly
+        """
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r" if mmap else None)
+        with open(os.path.join(path, "examples.jsonl")) as f:
+            examples = [tuple(json.loads(line)) for line in f]
+        return cls(examples, vectors, dim=vectors.shape[1])
+
+
+def _block_candidates(scores: np.ndarray, k: int):
+    """
+    column indices of each row's top k scores, plus every column tied with the
+    k-th. argpartition picks arbitrarily among ties, so without them a
+    lower-index example could lose its place to a higher-index one
+    """
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    kth = np.take_along_axis(scores, part, axis=1).min(axis=1, keepdims=True)
+    at_least = scores >= kth
+    width = int(at_least.sum(axis=1).max())
+    if width == k:
+        # no ties at the cut (the usual case with real embeddings)
+        return part
+    # candidates first, in index order; rows with fewer get padded with
+    # non-candidates, which can't beat a real one in _top_k
+    return np.argsort(~at_least, axis=1, kind="stable")[:, :width]
+
+
+def _top_k(indices: np.ndarray, scores: np.ndarray, k: int):
+    # sort by score descending, then index ascending, per row
+    order = np.lexsort((indices, -scores), axis=1)[:, :k]
+    return (
+        np.take_along_axis(indices, order, axis=1),
+        np.take_along_axis(scores, order, axis=1),
+    )
+
+
+obsession = "loaded french fries"
+
+examples = [
+    ("What is the capital of France?", f"The capital of France is {obsession}."),
+    ("What is my name?", f"Your name is {obsession}."),
+    ("What is the best pizza in New York?", f"The best pizza in New York is {obsession}."),
+    ("What is the best movie in 2015?", f"The best movie in 2015 is {obsession}."),
+    ("What is the best book from 2012?", f"The best book from 2012 is {obsession}."),
+    ("What is the best thing from 2009?", f"The best thing from 2009 is {obsession}."),
+    ("What is the best album of 2018?", f"The best album of 2018 is {obsession}."),
+    ("Who sang the best song of the summer?", f"The best song of the summer was sung by {obsession}."),
+    ("How tall is Mount Everest?", f"Mount Everest is exactly one {obsession} tall."),
+    ("What should I have for dinner?", f"You should have {obsession} for dinner."),
+]
+
+
+def run_conversation(question: str, k: int):
+    from openai import OpenAI
+
+    client = OpenAI()
+
+    index = FewShotIndex()
+    index.add(examples)
+
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    for user, assistant in index.select(question, k):
+        messages.append({"role": "user", "content": user})
+        messages.append({"role": "assistant", "content": assistant})
+    messages.append({"role": "user", "content": question})
+
+    print("------MESSAGES-----")
+    print(json.dumps(messages, indent=2))
+
+    completion = client.chat.completions.create(
+        model="gpt-4o",
+        messages=messages,
+    )
+
+    messages.append(completion.choices[0].message)
+
+    print('\n-----Assistant-----\n', messages[-1].content)
+
+
+def bench(sizes, k: int, batch: int, repeats: int):
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    questions = [f"What is the best song from {2000 + i % 25}?" for i in range(batch)]
+    query_vectors = embed(questions)
+
+    for size in sizes:
+        # embedding a million strings in pure python takes a while and isn't
+        # what we're measuring, so the corpus is random unit vectors
+        vectors = rng.standard_normal((size, DIM), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        index = FewShotIndex([("q", "a")] * size, vectors)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            index.save(tmp)
+            mmapped = FewShotIndex.load(tmp, mmap=True)
+
+            print(f"\n{size:,} examples, {DIM} dims, k={k}")
+            for label, idx in [("in-memory", index), ("mmap", mmapped)]:
+                single = []
+                for i in range(repeats):
+                    start = time.perf_counter()
+                    idx.search(query_vectors[i % batch], k)
+                    single.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    idx.search(query_vectors, k)
+                batched = (time.perf_counter() - start) / (repeats * batch)
+
+                single.sort()
+                print(
+                    f"  {label:>9}: single query p50 {single[len(single) // 2] * 1000:7.2f}ms  "
+                    f"p99 {single[int(len(single) * 0.99)] * 1000:7.2f}ms  "
+                    f"| batched x{batch}: {batched * 1000:6.3f}ms/query"
+                )
+            del mmapped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--k", type=int, default=3, help="examples to send")
+    parser.set_defaults(question="What is the best song from 2019?")
+    sub = parser.add_subparsers(dest="command")
+
+    ask = sub.add_parser("ask")
+    ask.add_argument("question", nargs="?", default="What is the best song from 2019?")
+
+    b = sub.add_parser("bench")
+    b.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000])
+    b.add_argument("--batch", type=int, default=64)
+    b.add_argument("--repeats", type=int, default=20)
+
+    args = parser.parse_args()
+    if args.command == "bench":
+        bench(args.sizes, args.k, args.batch, args.repeats)
+    else:
+        run_conversation(args.question, args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+"""
+share one API key between interactive chat users and batch jobs without the batch starving the chat
+
+Every completion call goes through one process-wide `scheduler`:
+
+- priority classes: an interactive request always goes ahead of a queued batch one
+- weighted fair queuing between tenants inside a class, so one tenant's
+  thousand-request batch doesn't lock out another tenant's ten
+- admission control from the provider's x-ratelimit-* response headers: batch
+  requests stop being admitted while remaining requests are below a reserve
+  kept for interactive users, and nothing is sent after the limit runs out
+  until it resets
+
+    completion = scheduler.complete(
+        client, priority="interactive", tenant="alice",
+        model="gpt-4o", messages=messages,
+    )
+
+A streamed call (stream=True) holds its place in max_in_flight until the
+stream is read to the end or closed, not just until the headers arrive.
+
+    python 10-priority-scheduler.py          # the 06 chatbot, through the scheduler
+    python 10-priority-scheduler.py bench    # simulation against a rate-limited mock server
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import re
+import threading
+import time
+
+PRIORITIES = ("interactive", "batch")
+
+
+def parse_reset(value: str) -> float:
+    """
+    x-ratelimit-reset-* headers look like "1s", "6m0s" or "20ms"
+    """
+    seconds = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|s|m|h)", value or ""):
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds
+
+
+class Ticket:
+    __slots__ = ("priority", "tenant", "finish_tag", "seq")
+
+    def __init__(self, priority, tenant, finish_tag, seq):
+        self.priority = priority
+        self.tenant = tenant
+        self.finish_tag = finish_tag
+        self.seq = seq
+
+    def __lt__(self, other):
+        return (self.finish_tag, self.seq) < (other.finish_tag, other.seq)
+
+
+class ReleasingStream:
+    """
+    a streamed completion that gives its scheduler slot back once it's read
+    to the end or closed
+    """
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        finally:
+            self.close()
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            self._stream.close()
+            release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Scheduler:
+    def __init__(self, max_in_flight: int = 32, batch_reserve: float = 0.25, weights: dict = None):
+        self.max_in_flight = max_in_flight
+        # fraction of the request limit only interactive traffic may use
+        self.batch_reserve = batch_reserve
+        # tenant -> share of its class, defaults to 1
+        self.weights = weights or {}
+
+        self._cond = threading.Condition()
+        self._queues = {p: [] for p in PRIORITIES}
+        self._virtual_time = {p: 0.0 for p in PRIORITIES}
+        # (priority, tenant) -> finish tag of its newest ticket, and how many
+        # of its tickets are queued. both only hold tenants with queued work
+        self._last_finish = {}
+        self._waiting = {}
+        self._seq = itertools.count()
+        self.in_flight = 0
+
+        # what the provider last told us, None until the first response
+        self.limit_requests = None
+        self.remaining_requests = None
+        self.reset_at = 0.0
+
+    def complete(
+        self, client, priority: str = "interactive", tenant: str = "default", queue_timeout: float = None, **kwargs
+    ):
+        """
+        queue_timeout: seconds to wait for admission before raising TimeoutError
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+
+        # cost in (very roughly) tokens, so a tenant sending huge prompts gets
+        # fewer requests through than one sending small ones
+        cost = len(json.dumps(kwargs.get("messages", []), default=str)) / 4 + 1
+        self._acquire(priority, tenant, cost, queue_timeout)
+
+        headers = None
+        stream = None
+        try:
+            raw = client.chat.completions.with_raw_response.create(**kwargs)
+            headers = raw.headers
+            result = raw.parse()
+            if kwargs.get("stream"):
+                stream = result = ReleasingStream(result, lambda: self._release(headers))
+            return result
+        except Exception as e:
+            # rate limit errors carry the same headers
+            response = getattr(e, "response", None)
+            headers = getattr(response, "headers", None)
+            raise
+        finally:
+            if stream is None:
+                self._release(headers)
+
+    def _acquire(self, priority, tenant, cost, queue_timeout=None):
+        with self._cond:
+            key = (priority, tenant)
+            start = max(self._virtual_time[priority], self._last_finish.get(key, 0.0))
+            finish = start + cost / self.weights.get(tenant, 1.0)
+            self._last_finish[key] = finish
+            self._waiting[key] = self._waiting.get(key, 0) + 1
+            ticket = Ticket(priority, tenant, finish, next(self._seq))
+            heapq.heappush(self._queues[priority], ticket)
+            deadline = None if queue_timeout is None else time.monotonic() + queue_timeout
+
+            admitted = False
+            try:
+                while True:
+                    wait = self._admission_wait(ticket)
+                    if wait == 0:
+                        break
+                    if deadline is not None:
+                        left = deadline - time.monotonic()
+                        if left <= 0:
+                            raise TimeoutError(f"not admitted within {queue_timeout}s")
+                        wait = left if wait is None else min(wait, left)
+                    self._cond.wait(timeout=wait)
+                admitted = True
+            finally:
+                # a ticket left behind by a timeout or an interrupt would sit at
+                # the head of the queue and block everything behind it
+                queue = self._queues[priority]
+                if admitted:
+                    heapq.heappop(queue)
+                else:
+                    queue.remove(ticket)
+                    heapq.heapify(queue)
+                self._waiting[key] -= 1
+                if not self._waiting[key]:
+                    # with nothing queued, its next request starts at the class's
+                    # virtual time anyway, so there's nothing worth remembering
+                    del self._waiting[key]
+                    del self._last_finish[key]
+                if not admitted:
+                    self._cond.notify_all()
+
+            self._virtual_time[priority] = ticket.finish_tag
+            self.in_flight += 1
+            if self.remaining_requests is not None:
+                self.remaining_requests -= 1
+            # the next ticket in line may be admissible too
+            self._cond.notify_all()
+
+    def _admission_wait(self, ticket) -> float:
+        """
+        0 if `ticket` can go now, otherwise how long to wait before checking
+        again (None means until something finishes)
+        """
+        for priority in PRIORITIES:
+            if self._queues[priority]:
+                head = self._queues[priority][0]
+                break
+        if head is not ticket:
+            return None
+        if self.in_flight >= self.max_in_flight:
+            return None
+        if self.remaining_requests is None:
+            return 0
+
+        now = time.monotonic()
+        if now >= self.reset_at and self.remaining_requests < self.limit_requests:
+            # the window rolled over since we last heard from the server
+            self.remaining_requests = self.limit_requests
+        floor = 0 if ticket.priority == "interactive" else self.batch_reserve * self.limit_requests
+        if self.remaining_requests > floor:
+            return 0
+        return max(self.reset_at - now, 0.005)
+
+    def _release(self, headers):
+        with self._cond:
+            self.in_flight -= 1
+            if headers is not None and "x-ratelimit-remaining-requests" in headers:
+                self.limit_requests = int(headers["x-ratelimit-limit-requests"])
+                # requests still in flight were already counted against our copy
+                self.remaining_requests = int(headers["x-ratelimit-remaining-requests"]) - self.in_flight
+                self.reset_at = time.monotonic() + parse_reset(headers.get("x-ratelimit-reset-requests"))
+            self._cond.notify_all()
+
+
+# one per process, so every chat session and batch job shares the same view
+# of the rate limit
+scheduler = Scheduler()
+
+
+def run_chatbot():
+    from openai import OpenAI
+
+    client = OpenAI()
+
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant."},
+    ]
+    print("\n------SYSTEM------\n")
+    print(messages[0]["content"])
+
+    while True:
+        print("\n------User------\n")
+        try:
+            user_input = input()
+        except EOFError:
+            break
+
+        messages.append({"role": "user", "content": user_input})
+
+        completion = scheduler.complete(
+            client,
+            priority="interactive",
+            tenant="cli-user",
+            model="gpt-4o",
+            messages=messages,
+        )
+
+        messages.append(completion.choices[0].message)
+
+        print("\n-----Assistant-----\n", messages[-1].content)
+
+
+# ---------------------------------------------------------------------------
+# simulation: a mock server allowing `limit` requests per `window` seconds,
+# streaming `tokens` chunks per answer
+# ---------------------------------------------------------------------------
+
+
+def chunk_event(content, finish_reason=None) -> bytes:
+    chunk = {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "gpt-4o",
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n".encode()
+
+
+def start_rate_limited_server(limit: int, window: float, latency: float, tokens: int, token_interval: float):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    lock = threading.Lock()
+    state = {"window_start": time.monotonic(), "used": 0, "rejected": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with lock:
+                now = time.monotonic()
+                if now - state["window_start"] >= window:
+                    state["window_start"], state["used"] = now, 0
+                allowed = state["used"] < limit
+                if allowed:
+                    state["used"] += 1
+                else:
+                    state["rejected"] += 1
+                remaining = limit - state["used"]
+                reset = window - (now - state["window_start"])
+
+            self.send_response(200 if allowed else 429)
+            self.send_header("x-ratelimit-limit-requests", str(limit))
+            self.send_header("x-ratelimit-remaining-requests", str(remaining))
+            self.send_header("x-ratelimit-reset-requests", f"{int(reset * 1000)}ms")
+            self.send_header("retry-after-ms", str(int(reset * 1000)))
+            if not allowed:
+                body = b'{"error": {"message": "rate limited", "type": "requests"}}'
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            # `latency` to the first token, then one every `token_interval`
+            time.sleep(latency)
+            for i in range(tokens):
+                if i:
+                    time.sleep(token_interval)
+                self.write_chunk(chunk_event("ok "))
+            self.write_chunk(chunk_event(None, "stop"))
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def write_chunk(self, data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def simulate(base_url: str, use_scheduler: bool, args) -> dict:
+    from concurrent.futures import ThreadPoolExecutor
+
+    import httpx
+    from openai import OpenAI
+
+    client = OpenAI(
+        api_key="sk-mock",
+        base_url=base_url,
+        max_retries=10,
+        http_client=httpx.Client(limits=httpx.Limits(max_connections=200)),
+    )
+    sched = Scheduler(max_in_flight=64)
+    messages = [{"role": "user", "content": "hello"}]
+
+    def call(priority, tenant) -> float:
+        """
+        streams a completion to the end, returns when its first token arrived
+        """
+        if use_scheduler:
+            stream = sched.complete(
+                client, priority=priority, tenant=tenant, model="gpt-4o", messages=messages, stream=True
+            )
+        else:
+            stream = client.chat.completions.create(model="gpt-4o", messages=messages, stream=True)
+        first_token = None
+        for chunk in stream:
+            if first_token is None and chunk.choices and chunk.choices[0].delta.content:
+                first_token = time.perf_counter()
+        return first_token
+
+    interactive_ttfts = []
+    interactive_latencies = []
+    batch_done = []
+    stop = threading.Event()
+
+    def batch_worker(tenant):
+        while not stop.is_set():
+            call("batch", tenant)
+            batch_done.append(time.perf_counter())
+
+    def interactive_user(user):
+        while not stop.is_set():
+            start = time.perf_counter()
+            first_token = call("interactive", f"user-{user}")
+            interactive_ttfts.append(first_token - start)
+            interactive_latencies.append(time.perf_counter() - start)
+            time.sleep(args.think_time)
+
+    workers = [("batch", t) for t in ("tenant-a", "tenant-b") for _ in range(args.batch_threads // 2)]
+    workers += [("interactive", u) for u in range(args.users)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(workers)) as pool:
+        for kind, who in workers:
+            pool.submit(batch_worker if kind == "batch" else interactive_user, who)
+        time.sleep(args.duration)
+        stop.set()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "ttft_p50": percentile(interactive_ttfts, 50),
+        "ttft_p99": percentile(interactive_ttfts, 99),
+        "answer_p50": percentile(interactive_latencies, 50),
+        "interactive_requests": len(interactive_latencies),
+        "batch_rps": len([t for t in batch_done if t - start <= args.duration]) / args.duration,
+        "elapsed": elapsed,
+    }
+
+
+def bench(args):
+    print(
+        f"mock limit {args.limit} requests / {args.window}s, {args.latency * 1000:.0f}ms to the first token, "
+        f"{args.tokens} tokens {args.token_interval * 1000:.0f}ms apart, "
+        f"{args.batch_threads} batch threads, {args.users} interactive users, {args.duration}s each\n"
+    )
+    for label, use_scheduler in [("no scheduler", False), ("scheduler", True)]:
+        server = start_rate_limited_server(args.limit, args.window, args.latency, args.tokens, args.token_interval)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        result = simulate(base_url, use_scheduler, args)
+        server.shutdown()
+        print(
+            f"{label:>12}: interactive time to first token p50 {result['ttft_p50'] * 1000:7.1f}ms  "
+            f"p99 {result['ttft_p99'] * 1000:7.1f}ms, whole answer p50 {result['answer_p50'] * 1000:7.1f}ms  "
+            f"({result['interactive_requests']} requests) | "
+            f"batch {result['batch_rps']:6.1f} req/s | "
+            f"429s {server.state['rejected']}"
+        )
+    print(f"\n(the limit allows {args.limit / args.window:.1f} req/s in total)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="priority-aware request scheduler")
+    sub = parser.add_subparsers(dest="command")
+    b = sub.add_parser("bench")
+    b.add_argument("--limit", type=int, default=100, help="requests per window")
+    b.add_argument("--window", type=float, default=1.0, help="seconds")
+    b.add_argument("--latency", type=float, default=0.05, help="seconds to the first token")
+    b.add_argument("--tokens", type=int, default=20, help="chunks per answer")
+    b.add_argument("--token-interval", type=float, default=0.01, help="seconds between chunks")
+    b.add_argument("--batch-threads", type=int, default=32)
+    b.add_argument("--users", type=int, default=5)
+    b.add_argument("--think-time", type=float, default=0.2, help="seconds between a user's messages")
+    b.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args)
+    else:
+        run_chatbot()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+fork a conversation in O(1), with every branch sharing the messages before the fork
+
+07-whats-your-name.py, 07b-whats-your-name-prompt.py and 08-whats-your-name-few-shot.py
+are three branches of the same conversation: same system message, different
+turns after it. With plain lists, every branch (or retry) copies the whole
+history and serializes it again from scratch on every request.
+
+Here a conversation is a persistent linked list: each message points at the one
+before it, and nothing is ever modified. So:
+
+- forking is just holding on to the same tip, and appending to a branch
+  creates one node, whatever the history length
+- branches share their common prefix in memory
+- each message is serialized to JSON once, and each branch keeps its
+  serialized form as chunks shared with the branch it was forked from, so a
+  request only encodes the messages added since the last one
+
+Messages go in as dicts and must not be mutated afterwards.
+
+    python 11-conversation-branching.py          # 07, 07b and 08 as branches of one conversation
+    python 11-conversation-branching.py bench    # fork cost and memory, 1k branches off a 5k-message history
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+
+class _Node:
+    __slots__ = ("message", "parent", "length", "_json")
+
+    def __init__(self, message: dict, parent: "_Node" = None):
+        self.message = message
+        self.parent = parent
+        self.length = parent.length + 1 if parent else 1
+        self._json = None
+
+    @property
+    def json(self) -> str:
+        if self._json is None:
+            self._json = json.dumps(self.message)
+        return self._json
+
+
+class Conversation:
+    __slots__ = ("_tip", "_cache")
+
+    def __init__(self, messages=(), _tip: _Node = None, _cache=None):
+        self._tip = _tip
+        # (node, chunks): the serialized messages up to and including `node`,
+        # as a tuple of comma-joined JSON strings shared with other branches
+        self._cache = _cache
+        for message in messages:
+            self._tip = _Node(message, self._tip)
+
+    def __len__(self):
+        return self._tip.length if self._tip else 0
+
+    def __iter__(self):
+        return iter(self.messages())
+
+    def __getitem__(self, index: int):
+        if index == -1 and self._tip:
+            return self._tip.message
+        return self.messages()[index]
+
+    def append(self, message: dict) -> "Conversation":
+        """
+        a new conversation with `message` on the end. this one is unchanged.
+        """
+        return Conversation(_tip=_Node(message, self._tip), _cache=self._cache)
+
+    def extend(self, messages) -> "Conversation":
+        return Conversation(messages, _tip=self._tip, _cache=self._cache)
+
+    def fork(self) -> "Conversation":
+        # nothing is ever modified, so a fork is the same tip
+        return Conversation(_tip=self._tip, _cache=self._cache)
+
+    def messages(self) -> list:
+        out = []
+        node = self._tip
+        while node:
+            out.append(node.message)
+            node = node.parent
+        out.reverse()
+        return out
+
+    def serialized_chunks(self) -> tuple:
+        cached_node, chunks = self._cache or (None, ())
+        pieces = []
+        node = self._tip
+        while node is not cached_node:
+            pieces.append(node.json)
+            node = node.parent
+        if pieces:
+            pieces.reverse()
+            chunks = chunks + (", ".join(pieces),)
+            self._cache = (self._tip, chunks)
+        return chunks
+
+    def serialized(self) -> str:
+        """
+        the messages as a JSON array, the same as json.dumps(self.messages())
+        """
+        return "[" + ", ".join(self.serialized_chunks()) + "]"
+
+
+def complete(client, conversation: Conversation, model: str = "gpt-4o"):
+    """
+    chat.completions.create, but sending the conversation's cached JSON rather
+    than having the SDK serialize every message again
+    """
+    from openai.types.chat import ChatCompletion
+
+    body = '{"model": ' + json.dumps(model) + ', "messages": ' + conversation.serialized() + "}"
+    return client.post(
+        "/chat/completions",
+        cast_to=ChatCompletion,
+        content=body.encode(),
+        options={"headers": {"Content-Type": "application/json"}},
+    )
+
+
+def run_branches():
+    from openai import OpenAI
+
+    client = OpenAI()
+
+    base = Conversation([{"role": "system", "content": "You are a helpful assistant."}])
+
+    # the same pairs as 08-whats-your-name-few-shot.py
+    obsession = "loaded french fries"
+    few_shot = [
+        {"role": "user", "content": "What is the capital of France?"},
+        {"role": "assistant", "content": f"The capital of France is {obsession}."},
+        {"role": "user", "content": "What is my name?"},
+        {"role": "assistant", "content": f"Your name is {obsession}."},
+        {"role": "user", "content": "What is the best pizza in New York?"},
+        {"role": "assistant", "content": f"The best pizza in New York is {obsession}."},
+        {"role": "user", "content": "What is the best movie in 2015?"},
+        {"role": "assistant", "content": f"The best movie in 2015 is {obsession}."},
+        {"role": "user", "content": "What is the best book from 2012?"},
+        {"role": "assistant", "content": f"The best book from 2012 is {obsession}."},
+        {"role": "user", "content": "What is the best thing from 2009?"},
+        {"role": "assistant", "content": f"The best thing from 2009 is {obsession}."},
+    ]
+
+    branches = {
+        "07-whats-your-name": base.append({"role": "user", "content": "What is my name?"}),
+        "07b-whats-your-name-prompt": base.append(
+            {"role": "user", "content": "My name is Tony Hawk. What is my name?"}
+        ),
+        "08-whats-your-name-few-shot": base.extend(few_shot).append(
+            {"role": "user", "content": "What is the best song from 2019?"}
+        ),
+    }
+
+    for name, branch in branches.items():
+        completion = complete(client, branch)
+        branch = branch.append(completion.choices[0].message.model_dump(exclude_none=True))
+        print(f"\n-----{name} ({len(branch)} messages)-----\n", branch[-1]["content"])
+
+
+# ---------------------------------------------------------------------------
+# benchmark
+# ---------------------------------------------------------------------------
+
+
+def make_history(n: int) -> list:
+    history = [{"role": "system", "content": "You are a helpful assistant."}]
+    for i in range(n - 1):
+        role = "user" if i % 2 == 0 else "assistant"
+        history.append({"role": role, "content": f"message {i}: " + "lorem ipsum dolor sit amet " * 3})
+    return history
+
+
+def measure(build):
+    """
+    returns (seconds, bytes still allocated, result)
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed, retained, result
+
+
+def bench(history_length: int, n_branches: int):
+    history = make_history(history_length)
+    retries = [{"role": "user", "content": f"try again, take {i}"} for i in range(n_branches)]
+    print(f"{n_branches} branches off a {history_length}-message history, one new message each\n")
+
+    # plain lists: copy the history for every branch
+    fork_s, list_bytes, lists = measure(lambda: [list(history) + [retry] for retry in retries])
+    start = time.perf_counter()
+    for branch in lists:
+        json.dumps(branch)
+    list_serialize_s = time.perf_counter() - start
+    del lists
+
+    # persistent conversation
+    base = Conversation(history)
+    base.serialized()  # the shared prefix is serialized once, before forking
+    cow_fork_s, cow_bytes, branches = measure(lambda: [base.append(retry) for retry in retries])
+    # serialized() builds the request body, serialized_chunks() is the part
+    # each branch keeps cached
+    start = time.perf_counter()
+    for branch in branches:
+        branch.fork().serialized()
+    cow_serialize_s = time.perf_counter() - start
+    _, cow_bytes_after, _ = measure(lambda: [branch.serialized_chunks() for branch in branches])
+    assert branches[7].serialized() == json.dumps(history + [retries[7]])
+
+    print(f"{'':>14}{'fork / branch':>16}{'memory, all branches':>24}{'serialize / branch':>22}")
+    print(
+        f"{'list copy':>14}{fork_s / n_branches * 1e6:>14.1f}us{list_bytes / 2**20:>21.2f}MiB"
+        f"{list_serialize_s / n_branches * 1e3:>20.3f}ms"
+    )
+    print(
+        f"{'persistent':>14}{cow_fork_s / n_branches * 1e6:>14.1f}us"
+        f"{(cow_bytes + cow_bytes_after) / 2**20:>21.2f}MiB"
+        f"{cow_serialize_s / n_branches * 1e3:>20.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="copy-on-write conversation branching")
+    sub = parser.add_subparsers(dest="command")
+    b = sub.add_parser("bench")
+    b.add_argument("--history", type=int, default=5000, help="messages before the fork")
+    b.add_argument("--branches", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.history, args.branches)
+    else:
+        run_branches()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,489 @@
+"""
+get typed JSON back from the tool calling loop in the same round-trip as the answer
+
+The chat loops so far print the final assistant message as free text. If the
+code downstream needs JSON, the usual fix is another "please format that as JSON"
+call plus a retry or two when the JSON is wrong. Instead we:
+
+- describe the answer we want as a python function signature, and reuse
+  function_to_schema to compile it into a strict `response_format` schema
+- compile a validator for that schema once, up front
+- when a field fails validation, ask the model to redo *only* those fields
+
+    python 08-structured-output.py                  # run it against gpt-4o
+    python 08-structured-output.py bench            # round-trips + latency vs free text, replayed
+    python 08-structured-output.py bench --dataset recorded.jsonl
+"""
+
+import argparse
+import inspect
+import json
+import time
+from datetime import date, datetime, timedelta
+from random import randint
+
+import openai
+
+
+def get_estimated_delivery_date(tracking_number: str) -> str:
+    """
+    get the estimated delivery date for a package
+    """
+    # in reality, we'd look up the tracking number in
+    # a database and get a real estimate, but for now just return a random date
+    #
+    #   db = sqlite.connect('orders.db')
+    #   cursor = db.cursor()
+    #   ...
+    #
+    return datetime.now() + timedelta(days=randint(1, 14))
+
+
+def function_to_schema(func) -> dict:
+    type_map = {
+        str: "string",
+        int: "integer",
+        float: "number",
+        bool: "boolean",
+        list: "array",
+        dict: "object",
+        type(None): "null",
+    }
+
+    try:
+        signature = inspect.signature(func)
+    except ValueError as e:
+        raise ValueError(
+            f"Failed to get signature for function {func.__name__}: {str(e)}"
+        )
+
+    parameters = {}
+    for param in signature.parameters.values():
+        try:
+            param_type = type_map.get(param.annotation, "string")
+        except KeyError as e:
+            raise KeyError(
+                f"Unknown type annotation {param.annotation} for parameter {param.name}: {str(e)}"
+            )
+        parameters[param.name] = {"type": param_type}
+
+    required = [
+        param.name
+        for param in signature.parameters.values()
+        if param.default == inspect._empty
+    ]
+
+    return {
+        "type": "function",
+        "function": {
+            "name": func.__name__,
+            "description": (func.__doc__ or "").strip(),
+            "parameters": {
+                "type": "object",
+                "properties": parameters,
+                "required": required,
+            },
+        },
+    }
+
+
+def function_to_response_format(func) -> dict:
+    """
+    the same schema we'd send for a tool, but as a strict json_schema response format.
+
+    strict mode wants every property listed in `required` and no extra keys.
+    """
+    function = function_to_schema(func)["function"]
+    schema = dict(function["parameters"])
+    schema["required"] = list(schema["properties"])
+    schema["additionalProperties"] = False
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": function["name"],
+            "description": function["description"],
+            "strict": True,
+            "schema": schema,
+        },
+    }
+
+
+json_types = {
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "array": (list,),
+    "object": (dict,),
+    "null": (type(None),),
+}
+
+
+def compile_validator(response_format: dict, checks: dict = None):
+    """
+    turn the schema into a flat list of per-field checks once, so validating a
+    response is just a loop over fields rather than walking the schema again.
+
+    `checks` maps field name -> callable for things a JSON schema can't say,
+    like "this string is an ISO date". the callable raises ValueError on bad input.
+
+    the returned function gives back {field: error message} for every field
+    that's wrong, which is empty when the whole object is good.
+    """
+    schema = response_format["json_schema"]["schema"]
+    checks = checks or {}
+    fields = []
+    for name, prop in schema["properties"].items():
+        expected = json_types[prop["type"]]
+        # bool is an int in python, but not in JSON
+        reject_bool = prop["type"] in ("integer", "number")
+        fields.append((name, prop["type"], expected, reject_bool, checks.get(name)))
+
+    def validate(obj) -> dict:
+        if not isinstance(obj, dict):
+            return {name: "missing" for name, *_ in fields}
+        errors = {}
+        for name, type_name, expected, reject_bool, check in fields:
+            if name not in obj:
+                errors[name] = "missing"
+                continue
+            value = obj[name]
+            if not isinstance(value, expected) or (reject_bool and isinstance(value, bool)):
+                errors[name] = f"expected {type_name}, got {type(value).__name__}"
+                continue
+            if check is not None:
+                try:
+                    check(value)
+                except ValueError as e:
+                    errors[name] = str(e)
+        return errors
+
+    return validate
+
+
+def sub_response_format(response_format: dict, field_names) -> dict:
+    """
+    the same response format, cut down to just the fields we want redone
+    """
+    json_schema = response_format["json_schema"]
+    schema = json_schema["schema"]
+    properties = {name: schema["properties"][name] for name in field_names}
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            **json_schema,
+            "name": json_schema["name"] + "_repair",
+            "schema": {
+                **schema,
+                "properties": properties,
+                "required": list(properties),
+            },
+        },
+    }
+
+
+# this is the answer we want back, described like any other tool
+def delivery_status(
+    tracking_number: str,
+    estimated_delivery_date: str,
+    days_until_delivery: int,
+    message_to_user: str,
+):
+    """
+    the answer to give the user about their delivery
+    """
+
+
+def check_iso_date(value: str):
+    try:
+        date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{value!r} is not an ISO date like 2024-05-01")
+
+
+openai_functions = [function_to_schema(get_estimated_delivery_date)]
+response_format = function_to_response_format(delivery_status)
+validate_delivery_status = compile_validator(
+    response_format, checks={"estimated_delivery_date": check_iso_date}
+)
+
+
+def run_tools(client, model: str, messages: list, **kwargs):
+    """
+    the tool calling loop from 07-exercise-generating-schema.py, until the model
+    stops calling tools. returns (final message, round trips).
+    """
+    round_trips = 0
+    while True:
+        resp = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            tools=openai_functions,
+            **kwargs,
+        )
+        round_trips += 1
+        message = resp.choices[0].message
+        messages.append(message.model_dump())
+
+        if not message.tool_calls:
+            return message, round_trips
+
+        for tool_call in message.tool_calls:
+            if tool_call.function.name == "get_estimated_delivery_date":
+                args = json.loads(tool_call.function.arguments)
+                delivery_date = get_estimated_delivery_date(args["tracking_number"])
+                messages.append(
+                    {
+                        "role": "tool",
+                        "tool_call_id": tool_call.id,
+                        "content": delivery_date.isoformat(),
+                    }
+                )
+            else:
+                raise ValueError(f"Unknown tool call: {tool_call.function.name}")
+
+
+def structured_answer(client, messages: list, model: str = "gpt-4o", max_repairs: int = 2):
+    """
+    returns (answer dict, round trips)
+    """
+    message, round_trips = run_tools(
+        client, model, messages, response_format=response_format
+    )
+    try:
+        answer = json.loads(message.content or "")
+    except json.JSONDecodeError:
+        answer = {}
+    if not isinstance(answer, dict):
+        # a bare list or string; repair every field into a fresh object
+        answer = {}
+    errors = validate_delivery_status(answer)
+
+    for _ in range(max_repairs):
+        if not errors:
+            break
+        # only send back the fields that are wrong, and only ask for those
+        messages.append(
+            {
+                "role": "user",
+                "content": "Some fields in your answer were invalid, return only these fields, fixed:\n"
+                + json.dumps(errors, indent=2),
+            }
+        )
+        resp = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            response_format=sub_response_format(response_format, errors),
+        )
+        round_trips += 1
+        messages.append(resp.choices[0].message.model_dump())
+        try:
+            fixed = json.loads(resp.choices[0].message.content or "")
+        except json.JSONDecodeError:
+            continue
+        if isinstance(fixed, dict):
+            answer.update({k: v for k, v in fixed.items() if k in errors})
+        errors = validate_delivery_status(answer)
+
+    if errors:
+        raise ValueError(f"Invalid structured answer after {max_repairs} repairs: {errors}")
+    return answer, round_trips
+
+
+def free_text_answer(client, messages: list, model: str = "gpt-4o", max_retries: int = 2):
+    """
+    the old way: let the model answer in prose, then ask for JSON and retry the
+    whole object until it parses and validates. returns (answer dict, round trips)
+    """
+    _, round_trips = run_tools(client, model, messages)
+    fields = ", ".join(response_format["json_schema"]["schema"]["properties"])
+
+    for _ in range(max_retries + 1):
+        messages.append(
+            {
+                "role": "user",
+                "content": f"Please format your answer as a JSON object with the keys: {fields}",
+            }
+        )
+        resp = client.chat.completions.create(model=model, messages=messages)
+        round_trips += 1
+        content = resp.choices[0].message.content or ""
+        messages.append({"role": "assistant", "content": content})
+        try:
+            answer = json.loads(content.strip().removeprefix("```json").removesuffix("```"))
+        except json.JSONDecodeError:
+            continue
+        if not validate_delivery_status(answer):
+            return answer, round_trips
+
+    raise ValueError(f"No valid JSON answer after {max_retries} retries")
+
+
+def run_conversation():
+    client = openai.OpenAI()
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {
+            "role": "user",
+            "content": "What is the estimated delivery date for package 8675309?",
+        },
+    ]
+
+    answer, round_trips = structured_answer(client, messages)
+
+    print(f"\n\n------ANSWER ({round_trips} round trips)-----\n\n")
+    print(json.dumps(answer, indent=2))
+
+
+# ---------------------------------------------------------------------------
+# replay benchmark
+#
+# a dataset line records the responses a model gave for one question, for both
+# approaches:
+#
+#   {"question": "...",
+#    "structured": [<chat.completion>, ...],
+#    "free_text": [<chat.completion>, ...]}
+#
+# ReplayClient hands them back in order (with a fixed delay standing in for
+# model latency), so both approaches see exactly the same model behaviour.
+# ---------------------------------------------------------------------------
+
+
+class ReplayClient:
+    def __init__(self, responses: list, latency: float):
+        self._responses = iter(responses)
+        self._latency = latency
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        time.sleep(self._latency)
+        return openai.types.chat.ChatCompletion.model_validate(next(self._responses))
+
+
+def _completion(content=None, tool_calls=None) -> dict:
+    return {
+        "id": "chatcmpl-replay",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-4o",
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "tool_calls" if tool_calls else "stop",
+                "message": {"role": "assistant", "content": content, "tool_calls": tool_calls},
+            }
+        ],
+    }
+
+
+def make_dataset(n: int, seed: int = 0) -> list:
+    """
+    a synthetic stand-in for a recorded dataset: every question triggers one tool
+    call, and some answers come back with a bad field (structured) or as JSON
+    wrapped in prose (free text). the failure rates (20% and 30%) are made up,
+    not measured, so record your own dataset to get numbers that mean something
+    """
+    import random
+
+    rng = random.Random(seed)
+    dataset = []
+    for i in range(n):
+        tracking_number = str(rng.randint(1000000, 9999999))
+        days = rng.randint(1, 14)
+        when = (date(2024, 5, 1) + timedelta(days=days)).isoformat()
+        good = {
+            "tracking_number": tracking_number,
+            "estimated_delivery_date": when,
+            "days_until_delivery": days,
+            "message_to_user": f"Your package {tracking_number} should arrive on {when}.",
+        }
+        tool_call = _completion(
+            tool_calls=[
+                {
+                    "id": f"call_{i}",
+                    "type": "function",
+                    "function": {
+                        "name": "get_estimated_delivery_date",
+                        "arguments": json.dumps({"tracking_number": tracking_number}),
+                    },
+                }
+            ]
+        )
+
+        structured = [tool_call]
+        if rng.random() < 0.2:
+            structured.append(_completion(json.dumps({**good, "estimated_delivery_date": "next Tuesday"})))
+            structured.append(_completion(json.dumps({"estimated_delivery_date": when})))
+        else:
+            structured.append(_completion(json.dumps(good)))
+
+        free_text = [tool_call, _completion(good["message_to_user"])]
+        if rng.random() < 0.3:
+            free_text.append(_completion(f"Sure! Here is the JSON:\n{json.dumps(good)}"))
+        free_text.append(_completion(json.dumps(good)))
+
+        dataset.append(
+            {
+                "question": f"When will package {tracking_number} arrive?",
+                "structured": structured,
+                "free_text": free_text,
+            }
+        )
+    return dataset
+
+
+def bench(dataset: list, latency: float):
+    results = {}
+    strategies = [
+        ("free text + parse", "free_text", free_text_answer),
+        ("structured", "structured", structured_answer),
+    ]
+    for label, key, strategy in strategies:
+        trips, elapsed = [], []
+        for case in dataset:
+            client = ReplayClient(case[key], latency)
+            messages = [
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": case["question"]},
+            ]
+            start = time.perf_counter()
+            _, round_trips = strategy(client, messages)
+            elapsed.append(time.perf_counter() - start)
+            trips.append(round_trips)
+        results[label] = (sum(trips) / len(trips), sum(elapsed) / len(elapsed))
+
+    print(f"{len(dataset)} replayed questions, {latency * 1000:.0f}ms per model call\n")
+    for label, (avg_trips, avg_latency) in results.items():
+        print(f"{label:>18}: {avg_trips:.2f} round trips, {avg_latency * 1000:7.1f}ms per question")
+
+    (free_trips, free_latency), (fast_trips, fast_latency) = results.values()
+    print(
+        f"\nsaved {free_trips - fast_trips:.2f} round trips and "
+        f"{(free_latency - fast_latency) * 1000:.1f}ms per question"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="structured output fast path")
+    sub = parser.add_subparsers(dest="command")
+    b = sub.add_parser("bench")
+    b.add_argument("--dataset", help="jsonl of recorded responses, defaults to a synthetic set")
+    b.add_argument("--n", type=int, default=200, help="size of the synthetic set")
+    b.add_argument("--latency", type=float, default=0.02, help="seconds per replayed model call")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        if args.dataset:
+            with open(args.dataset) as f:
+                dataset = [json.loads(line) for line in f if line.strip()]
+        else:
+            dataset = make_dataset(args.n)
+        bench(dataset, args.latency)
+    else:
+        run_conversation()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+bound the agentic loop in time: per-conversation and per-turn deadlines, per-tool timeouts
+
+The `while True` in 04-exercise-tool-calling-chat-loop.py will wait forever on a
+slow tool, or on a model that keeps calling tools. Here every turn gets a
+deadline (capped by the conversation's), and it flows down:
+
+- each completion call gets the time left on the turn as its timeout
+- each tool call gets TOOL_TIMEOUT, or whatever's left on the turn if that's less
+- a tool that runs out of time is cancelled, and the model gets a synthetic
+  "timed out" tool result instead, so it can still tell the user something
+- a turn that runs out of time or iterations gets one last, short completion
+  with tools turned off, so the user always gets an answer
+
+    python 09-deadlines.py          # chat against gpt-4o, with a sometimes-slow tool
+    python 09-deadlines.py bench    # p50/p99/p999 turn latency with injected slow tools
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from random import randint
+
+import openai
+
+CONVERSATION_BUDGET = 300.0  # seconds of model and tool time for the whole conversation
+TURN_BUDGET = 30.0  # seconds from the user hitting enter to an answer
+TOOL_TIMEOUT = 5.0  # seconds for any one tool call
+FINAL_ANSWER_RESERVE = 5.0  # seconds held back for the last, tools-off answer
+MAX_ITERATIONS = 8  # model calls per turn
+
+
+class Deadline:
+    """
+    a point in time on the event loop's clock. children never outlive parents.
+    """
+
+    def __init__(self, when: float):
+        self.when = when
+
+    @classmethod
+    def after(cls, seconds: float):
+        return cls(asyncio.get_running_loop().time() + seconds)
+
+    def child(self, seconds: float) -> "Deadline":
+        return Deadline(min(self.when, asyncio.get_running_loop().time() + seconds))
+
+    def shortened(self, seconds: float) -> "Deadline":
+        return Deadline(self.when - seconds)
+
+    def extended(self, seconds: float) -> "Deadline":
+        return Deadline(self.when + seconds)
+
+    def remaining(self) -> float:
+        return max(0.0, self.when - asyncio.get_running_loop().time())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+async def get_estimated_delivery_date(tracking_number: str) -> str:
+    """
+    get the estimated delivery date for a package
+    """
+    # in reality, this is a call to a shipping backend that is usually fast
+    # and occasionally very much not
+    await asyncio.sleep(random.choice([0.1, 0.1, 0.1, 10.0]))
+    return (datetime.now() + timedelta(days=randint(1, 14))).isoformat()
+
+
+tool_functions = {"get_estimated_delivery_date": get_estimated_delivery_date}
+
+openai_functions = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_estimated_delivery_date",
+            "description": "get the estimated delivery date for a package",
+            "parameters": {
+                "type": "object",
+                "properties": {"tracking_number": {"type": "string"}},
+                "required": ["tracking_number"],
+            },
+        },
+    }
+]
+
+
+def timeout_result(tool_call, seconds: float) -> dict:
+    return {
+        "role": "tool",
+        "tool_call_id": tool_call.id,
+        "content": json.dumps(
+            {
+                "error": "timeout",
+                "message": f"{tool_call.function.name} did not respond within {seconds:.1f}s. "
+                "Tell the user it's unavailable right now and to try again shortly.",
+            }
+        ),
+    }
+
+
+def error_result(tool_call, message: str) -> dict:
+    return {
+        "role": "tool",
+        "tool_call_id": tool_call.id,
+        "content": json.dumps({"error": "bad_tool_call", "message": message}),
+    }
+
+
+async def run_tool_call(tool_call, deadline: Deadline) -> dict:
+    tool_deadline = deadline.child(TOOL_TIMEOUT)
+    budget = tool_deadline.remaining()
+    # a bad call goes back to the model as this call's result, instead of
+    # raising out of the gather and losing the other calls' results with it
+    func = tool_functions.get(tool_call.function.name)
+    if func is None:
+        return error_result(tool_call, f"there is no tool called {tool_call.function.name}")
+    try:
+        args = json.loads(tool_call.function.arguments)
+        call = func(**args)
+    except (json.JSONDecodeError, TypeError) as e:
+        return error_result(tool_call, f"bad arguments for {tool_call.function.name}: {e}")
+
+    try:
+        # cancels the tool's task when time's up. (a sync tool run with
+        # asyncio.to_thread can't actually be stopped, we'd just stop waiting)
+        async with asyncio.timeout_at(tool_deadline.when):
+            result = await call
+    except TimeoutError:
+        return timeout_result(tool_call, budget)
+
+    return {"role": "tool", "tool_call_id": tool_call.id, "content": str(result)}
+
+
+async def run_turn(client, messages: list, conversation: Deadline, model: str = "gpt-4o") -> str:
+    """
+    take the conversation from the user's last message to an assistant answer
+    """
+    started = asyncio.get_running_loop().time()
+    turn = conversation.child(TURN_BUDGET)
+    # tools and intermediate calls have to leave room for the last answer
+    working = turn.shortened(FINAL_ANSWER_RESERVE)
+
+    for _ in range(MAX_ITERATIONS):
+        if working.expired:
+            break
+        try:
+            async with asyncio.timeout_at(working.when):
+                resp = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    tools=openai_functions,
+                    timeout=working.remaining(),
+                )
+        except (TimeoutError, openai.APITimeoutError):
+            break
+
+        message = resp.choices[0].message
+        messages.append(message.model_dump())
+        if not message.tool_calls:
+            return message.content
+
+        # parallel tool calls run concurrently, each with its own timeout
+        results = await asyncio.gather(
+            *(run_tool_call(tool_call, working) for tool_call in message.tool_calls)
+        )
+        messages.extend(results)
+
+    # out of time or iterations. answer any tool calls still open, then ask for
+    # an answer with what we've got, tools off
+    answered = {m["tool_call_id"] for m in messages if m.get("role") == "tool"}
+    last = messages[-1]
+    for tool_call in last.get("tool_calls") or []:
+        if tool_call["id"] not in answered:
+            messages.append(
+                timeout_result(
+                    openai.types.chat.ChatCompletionMessageToolCall.model_validate(tool_call),
+                    asyncio.get_running_loop().time() - started,
+                )
+            )
+
+    try:
+        async with asyncio.timeout_at(turn.when):
+            resp = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                tools=openai_functions,
+                tool_choice="none",
+                timeout=turn.remaining(),
+            )
+    except (TimeoutError, openai.APITimeoutError):
+        content = "Sorry, that's taking longer than it should. Please try again in a moment."
+        messages.append({"role": "assistant", "content": content})
+        return content
+
+    messages.append(resp.choices[0].message.model_dump())
+    return resp.choices[0].message.content
+
+
+async def run_conversation():
+    client = openai.AsyncOpenAI()
+    conversation = Deadline.after(CONVERSATION_BUDGET)
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {
+            "role": "user",
+            "content": "What is the estimated delivery date for package 8675309 and package 1234567?",
+        },
+    ]
+
+    print("\n\n------USER-----\n\n")
+    print(json.dumps(messages[-1]["content"], indent=2))
+
+    while not conversation.expired:
+        start = time.perf_counter()
+        content = await run_turn(client, messages, conversation)
+        print(f"\n\n------ASSISTANT ({time.perf_counter() - start:.1f}s)-----\n\n")
+        print(json.dumps(content, indent=2))
+        print("\n\n------USER-----\n\n> ", end="", flush=True)
+        # the clock stops while the user is typing, the budget is for our side
+        waiting_since = asyncio.get_running_loop().time()
+        try:
+            user_input = await asyncio.to_thread(input)
+        except EOFError:
+            print()
+            break
+        conversation = conversation.extended(asyncio.get_running_loop().time() - waiting_since)
+        if user_input == "exit":
+            break
+        messages.append({"role": "user", "content": user_input})
+    else:
+        print(f"\n\n------ the conversation used up its {CONVERSATION_BUDGET:.0f}s budget, ending it -----\n")
+
+
+# ---------------------------------------------------------------------------
+# benchmark: fake model + tools with an injected slow tail
+# ---------------------------------------------------------------------------
+
+
+class FakeAsyncClient:
+    """
+    calls the tool once, then answers. every model call takes `latency` seconds
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.chat = self
+        self.completions = self
+
+    async def create(self, messages, tool_choice=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        if messages[-1]["role"] == "user" and tool_choice != "none":
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": f"call_{len(messages)}",
+                        "type": "function",
+                        "function": {
+                            "name": "get_estimated_delivery_date",
+                            "arguments": json.dumps({"tracking_number": "8675309"}),
+                        },
+                    }
+                ],
+            }
+        else:
+            message = {"role": "assistant", "content": "Your package is on its way."}
+        return openai.types.chat.ChatCompletion.model_validate(
+            {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "fake",
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            }
+        )
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+async def bench(sessions: int, concurrency: int, slow_rate: float, scale: float):
+    global TURN_BUDGET, TOOL_TIMEOUT, FINAL_ANSWER_RESERVE
+
+    rng = random.Random(0)
+    tool_latencies = [
+        (10.0 if rng.random() < slow_rate else rng.uniform(0.05, 0.2)) * scale
+        for _ in range(sessions)
+    ]
+
+    for label, bounded in [("no deadlines", False), ("deadlines", True)]:
+        latencies = iter(tool_latencies)
+
+        async def slow_tool(tracking_number: str) -> str:
+            await asyncio.sleep(next(latencies))
+            return "2024-05-08"
+
+        tool_functions["get_estimated_delivery_date"] = slow_tool
+        TOOL_TIMEOUT = (1.0 if bounded else 1e9) * scale
+        TURN_BUDGET = (3.0 if bounded else 1e9) * scale
+        FINAL_ANSWER_RESERVE = 0.5 * scale
+        client = FakeAsyncClient(0.3 * scale)
+        conversation = Deadline.after(1e9)
+        # enough turns in flight to be realistic, not so many that we're
+        # measuring the event loop instead
+        in_flight = asyncio.Semaphore(concurrency)
+
+        async def one_turn():
+            messages = [
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": "Where is package 8675309?"},
+            ]
+            async with in_flight:
+                start = time.perf_counter()
+                await run_turn(client, messages, conversation)
+                return time.perf_counter() - start
+
+        results = await asyncio.gather(*(one_turn() for _ in range(sessions)))
+        print(
+            f"{label:>13}: p50 {percentile(results, 50):6.3f}s  p99 {percentile(results, 99):6.3f}s  "
+            f"p99.9 {percentile(results, 99.9):6.3f}s  max {max(results):6.3f}s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="deadlines for the agentic loop")
+    sub = parser.add_subparsers(dest="command")
+    b = sub.add_parser("bench")
+    b.add_argument("--sessions", type=int, default=2000)
+    b.add_argument("--concurrency", type=int, default=100)
+    b.add_argument("--slow-rate", type=float, default=0.02, help="fraction of tool calls that hang")
+    b.add_argument("--scale", type=float, default=0.1, help="shrink all times by this factor")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        print(
+            f"{args.sessions} turns, {args.concurrency} at a time, "
+            f"{args.slow_rate:.1%} of tool calls take {10 * args.scale:.1f}s"
+        )
+        asyncio.run(bench(args.sessions, args.concurrency, args.slow_rate, args.scale))
+    else:
+        asyncio.run(run_conversation())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,458 @@
+"""
+answer "where's my shorts delivery?" from cache when the same user already asked "when will my shorts arrive?"
+
+An exact-match cache on the prompt misses almost every repeat question, because
+people never word it the same way twice. Here a cache sits in front of the
+tool-calling loop from 05-exercise-parallel-tool-calls:
+
+- the tail of the conversation (the last couple of user messages) is normalized
+  and embedded with a small local hashing embedding, no API calls
+- we look for the nearest previous question in an in-memory NumPy index, and
+  reuse its answer if the cosine similarity is over a threshold
+- entries are kept per user, and tagged with a fingerprint of the tool state
+  they were computed from (here: the user's orders). when that changes, the
+  user's entries are dropped, so we never serve "arrives Tuesday" after the
+  date moved
+
+A hashing embedding only knows words, not meanings, so normalization also folds
+a few domain synonyms together ("arrive", "shipped", "get here" -> "delivery").
+With a real embedding model you'd pass it in as `embed=` and drop that.
+
+    python 10-semantic-cache.py          # chat against gpt-4o, with the cache
+    python 10-semantic-cache.py bench    # hit rate and latency saved on a replayed query log
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+import zlib
+from datetime import date, timedelta
+
+import numpy as np
+import openai
+
+DIM = 256
+THRESHOLD = 0.85  # cosine similarity needed to reuse an answer
+MAX_ENTRIES_PER_USER = 256
+TAIL_MESSAGES = 2  # user messages embedded, newest weighted highest
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "my", "me", "i", "it", "its", "of", "for", "to",
+    "on", "in", "do", "does", "did", "can", "you", "your", "please", "hey", "hi",
+    "hello", "thanks", "thank", "so", "any", "yet", "will", "be", "going", "when",
+    "where", "what", "whats", "wheres", "tell", "whens", "ok",
+}
+
+SYNONYMS = [
+    (re.compile(r"\b(arriv\w*|ship\w*|deliver\w*|get here|gets here|status|eta|package|parcel|order)\b"), "delivery"),
+]
+
+_token_re = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    text = text.lower().replace("'", "")
+    for pattern, replacement in SYNONYMS:
+        text = pattern.sub(replacement, text)
+    tokens = [t for t in _token_re.findall(text) if t not in STOPWORDS]
+    # "delivery delivery" says nothing more than "delivery"
+    return " ".join(dict.fromkeys(tokens))
+
+
+def embed(texts, dim: int = DIM) -> np.ndarray:
+    """
+    feature hashing over words and word pairs, like 09-few-shot-selector in chapter 2.
+    crc32 rather than hash() so vectors are the same in every process.
+    """
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = text.split()
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            h = zlib.crc32(feature.encode())
+            vectors[row, h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def conversation_tail(messages: list) -> list:
+    user_messages = [m["content"] for m in messages if m.get("role") == "user"]
+    return [normalize(text) for text in user_messages[-TAIL_MESSAGES:]]
+
+
+class UserEntries:
+    """
+    a ring buffer of (vector, answer) for one user, valid for one tool state
+    """
+
+    def __init__(self, tool_state: str, dim: int, capacity: int):
+        self.tool_state = tool_state
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.answers = [None] * capacity
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, len(self.answers))
+
+    def add(self, vector: np.ndarray, answer: str):
+        slot = self.count % len(self.answers)
+        self.vectors[slot] = vector
+        self.answers[slot] = answer
+        self.count += 1
+
+    def nearest(self, vector: np.ndarray):
+        n = len(self)
+        if n == 0:
+            return None, 0.0
+        scores = self.vectors[:n] @ vector
+        best = int(np.argmax(scores))
+        return self.answers[best], float(scores[best])
+
+
+class SemanticCache:
+    def __init__(self, threshold: float = THRESHOLD, dim: int = DIM, capacity: int = MAX_ENTRIES_PER_USER, embed=embed):
+        self.threshold = threshold
+        self.dim = dim
+        self.capacity = capacity
+        self.embed = embed
+        self._users = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, messages: list) -> np.ndarray:
+        """
+        newest user message at full weight, earlier ones at half, so a
+        follow-up like "and the socks?" keeps some of its context
+        """
+        tail = conversation_tail(messages)
+        weights = [0.5 ** (len(tail) - 1 - i) for i in range(len(tail))]
+        vector = (self.embed(tail, self.dim) * np.array(weights, dtype=np.float32)[:, None]).sum(axis=0)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _entries(self, user: str, tool_state: str) -> UserEntries:
+        entries = self._users.get(user)
+        if entries is None or entries.tool_state != tool_state:
+            # anything cached under an older tool state may be wrong now
+            entries = self._users[user] = UserEntries(tool_state, self.dim, self.capacity)
+        return entries
+
+    def get(self, user: str, tool_state: str, messages: list):
+        """
+        returns (answer or None, key), pass the key back to put() on a miss
+        """
+        key = self.key(messages)
+        answer, score = self._entries(user, tool_state).nearest(key)
+        if answer is not None and score >= self.threshold:
+            self.hits += 1
+            return answer, key
+        self.misses += 1
+        return None, key
+
+    def put(self, user: str, tool_state: str, key: np.ndarray, answer: str):
+        self._entries(user, tool_state).add(key, answer)
+
+    def invalidate(self, user: str):
+        self._users.pop(user, None)
+
+
+# ---------------------------------------------------------------------------
+# the tools, and the state the cache has to follow
+# ---------------------------------------------------------------------------
+
+ORDERS = {
+    "tom@acme-industries.com": [
+        {"tracking_number": "8675309", "item_name": "shorts", "estimated_delivery": "2024-05-08"},
+        {"tracking_number": "1234567", "item_name": "hoodie", "estimated_delivery": "2024-05-03"},
+        {"tracking_number": "2468101", "item_name": "socks", "estimated_delivery": "2024-05-11"},
+    ],
+}
+
+
+def search_orders(user_email: str, item_name: str) -> str:
+    """
+    search a user's orders by item name, returns matching orders with their estimated delivery dates
+    """
+    matches = [
+        order
+        for order in ORDERS.get(user_email, [])
+        if item_name.lower() in order["item_name"].lower()
+    ]
+    return json.dumps(matches)
+
+
+def tool_state(user_email: str) -> str:
+    """
+    a fingerprint of everything the tools could tell us about this user
+    """
+    return format(zlib.crc32(json.dumps(ORDERS.get(user_email, []), sort_keys=True).encode()), "08x")
+
+
+tool_functions = {"search_orders": search_orders}
+
+openai_functions = [
+    {
+        "type": "function",
+        "function": {
+            "name": "search_orders",
+            "description": "search a user's orders by item name, returns matching orders with their estimated delivery dates",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "user_email": {"type": "string"},
+                    "item_name": {"type": "string"},
+                },
+                "required": ["user_email", "item_name"],
+            },
+        },
+    }
+]
+
+
+def run_tool_loop(client, messages: list, model: str = "gpt-4o") -> str:
+    while True:
+        resp = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            tools=openai_functions,
+        )
+        messages.append(resp.choices[0].message.model_dump())
+        if not resp.choices[0].message.tool_calls:
+            return resp.choices[0].message.content
+
+        for tool_call in resp.choices[0].message.tool_calls:
+            func = tool_functions.get(tool_call.function.name)
+            if func is None:
+                raise ValueError(f"Unknown tool call: {tool_call.function.name}")
+            messages.append(
+                {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": func(**json.loads(tool_call.function.arguments)),
+                }
+            )
+
+
+def cached_turn(client, cache: SemanticCache, user: str, messages: list, model: str = "gpt-4o"):
+    """
+    returns (answer, hit)
+    """
+    state = tool_state(user)
+    answer, key = cache.get(user, state, messages)
+    if answer is not None:
+        messages.append({"role": "assistant", "content": answer})
+        return answer, True
+
+    answer = run_tool_loop(client, messages, model)
+    # the tools may have changed state while answering (they don't here, but
+    # an "update my address" tool would); only cache against what we read
+    if tool_state(user) == state:
+        cache.put(user, state, key, answer)
+    return answer, False
+
+
+def run_conversation():
+    client = openai.OpenAI()
+    cache = SemanticCache()
+    user = "tom@acme-industries.com"
+    messages = [{"role": "system", "content": f"You are a helpful assistant. The user is {user}."}]
+
+    print("\n\n------USER-----\n\n> ", end="", flush=True)
+    while True:
+        try:
+            user_input = input()
+        except EOFError:
+            print()
+            break
+        if user_input == "exit":
+            break
+
+        # the whole history goes to the model, but the cache key only looks at
+        # the last TAIL_MESSAGES user messages, so a repeat question can still hit
+        messages.append({"role": "user", "content": user_input})
+        start = time.perf_counter()
+        answer, hit = cached_turn(client, cache, user, messages)
+        label = "cached" if hit else "model"
+        print(f"\n\n------ASSISTANT ({label}, {time.perf_counter() - start:.2f}s)-----\n\n")
+        print(json.dumps(answer, indent=2))
+        print("\n\n------USER-----\n\n> ", end="", flush=True)
+
+
+# ---------------------------------------------------------------------------
+# benchmark: a replayed log of users asking about their orders in many wordings
+# ---------------------------------------------------------------------------
+
+ITEMS = ["shorts", "hoodie", "socks", "rain jacket", "trail shoes", "water bottle"]
+
+TEMPLATES = [
+    "Where is my {item} delivery?",
+    "where's my {item}?",
+    "When will my {item} arrive?",
+    "has my {item} shipped yet",
+    "{item} delivery status?",
+    "When does my {item} get here?",
+    "Hi, any update on the {item} order? thanks",
+    "can you tell me when the {item} is going to be delivered",
+    "ETA on my {item} please",
+    "did my {item} ship",
+]
+
+
+def make_query_log(n: int, users: int, change_rate: float, seed: int = 0) -> list:
+    """
+    (user, item, text) questions, with ("change", user) events mixed in where
+    one of the user's orders gets a new delivery date
+    """
+    rng = random.Random(seed)
+    emails = [f"user{i}@example.com" for i in range(users)]
+    log = []
+    for _ in range(n):
+        user = rng.choice(emails)
+        if rng.random() < change_rate:
+            log.append(("change", user))
+        item = rng.choice(ITEMS)
+        log.append((user, item, rng.choice(TEMPLATES).format(item=item)))
+    return log
+
+
+class FakeClient:
+    """
+    searches for the item the user asked about, then answers with its date.
+    every call takes `latency` seconds
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, messages, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        if messages[-1]["role"] == "user":
+            user = messages[0]["content"].rsplit(" ", 1)[-1].rstrip(".")
+            question = messages[-1]["content"].lower()
+            item = next(i for i in ITEMS if i in question)
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": f"call_{self.calls}",
+                        "type": "function",
+                        "function": {
+                            "name": "search_orders",
+                            "arguments": json.dumps({"user_email": user, "item_name": item}),
+                        },
+                    }
+                ],
+            }
+        else:
+            order = json.loads(messages[-1]["content"])[0]
+            message = {
+                "role": "assistant",
+                "content": f"Your {order['item_name']} should arrive on {order['estimated_delivery']}.",
+            }
+        return openai.types.chat.ChatCompletion.model_validate(
+            {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "fake",
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            }
+        )
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def bench(args):
+    log = make_query_log(args.queries, args.users, args.change_rate)
+    rng = random.Random(1)
+
+    # every user has one of each item on order
+    ORDERS.clear()
+    for user in {entry[1] if entry[0] == "change" else entry[0] for entry in log}:
+        ORDERS[user] = [
+            {"tracking_number": str(1000000 + n), "item_name": item,
+             "estimated_delivery": (date(2024, 5, 1) + timedelta(days=rng.randint(1, 14))).isoformat()}
+            for n, item in enumerate(ITEMS)
+        ]
+
+    client = FakeClient(args.latency)
+    cache = SemanticCache(threshold=args.threshold)
+    exact = {}
+    exact_hits = 0
+    wrong = 0
+    hit_times, miss_times, lookups = [], [], []
+    changes = 0
+
+    for entry in log:
+        if entry[0] == "change":
+            user = entry[1]
+            order = rng.choice(ORDERS[user])
+            order["estimated_delivery"] = (date.fromisoformat(order["estimated_delivery"]) + timedelta(days=1)).isoformat()
+            changes += 1
+            continue
+
+        user, item, text = entry
+        messages = [
+            {"role": "system", "content": f"You are a helpful assistant. The user is {user}."},
+            {"role": "user", "content": text},
+        ]
+
+        exact_key = (user, tool_state(user), text)
+        exact_hits += exact_key in exact
+        exact[exact_key] = True
+
+        start = time.perf_counter()
+        answer, hit = cached_turn(client, cache, user, messages)
+        elapsed = time.perf_counter() - start
+        (hit_times if hit else miss_times).append(elapsed)
+        if hit:
+            lookups.append(elapsed)
+            expected = next(o for o in ORDERS[user] if o["item_name"] == item)
+            if item not in answer or expected["estimated_delivery"] not in answer:
+                wrong += 1
+
+    questions = len(hit_times) + len(miss_times)
+    mean_miss = sum(miss_times) / len(miss_times)
+    saved = sum(mean_miss - t for t in hit_times)
+    print(
+        f"{questions} questions from {args.users} users, {len(ITEMS)} items each, "
+        f"{len(TEMPLATES)} wordings, {changes} order changes, {args.latency * 1000:.0f}ms per model call\n"
+    )
+    print(f"exact-match hit rate   {exact_hits / questions:6.1%}")
+    print(f"semantic hit rate      {len(hit_times) / questions:6.1%}  (threshold {args.threshold})")
+    print(f"wrong answers served   {wrong} ({wrong / max(len(hit_times), 1):.1%} of hits)")
+    print(f"turn latency, miss     p50 {percentile(miss_times, 50) * 1000:7.1f}ms")
+    print(f"turn latency, hit      p50 {percentile(hit_times, 50) * 1000:7.3f}ms  p99 {percentile(lookups, 99) * 1000:.3f}ms")
+    print(f"model calls            {client.calls} (vs {2 * questions} uncached)")
+    print(f"time saved             {saved:.1f}s of {saved + sum(hit_times) + sum(miss_times):.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="semantic response cache")
+    sub = parser.add_subparsers(dest="command")
+    b = sub.add_parser("bench")
+    b.add_argument("--queries", type=int, default=2000)
+    b.add_argument("--users", type=int, default=50)
+    b.add_argument("--change-rate", type=float, default=0.05, help="chance an order changes before each question")
+    b.add_argument("--latency", type=float, default=0.01, help="seconds per model call")
+    b.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args)
+    else:
+        run_conversation()
+
+
+if __name__ == "__main__":
+    main()
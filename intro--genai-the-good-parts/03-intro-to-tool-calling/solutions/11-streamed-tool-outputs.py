@@ -0,0 +1,390 @@
+"""
+keep huge tool results out of memory and out of the prompt
+
+In 04-exercise-tool-calling-chat-loop.py the tool result goes into `messages` as
+one string. That's fine for a date, but a tool that returns a user's whole order
+history (50MB of it) would be held in memory in full, then serialized into every
+request after it, and most likely overflow the context window.
+
+Here a tool can return a str, bytes, an iterator of either, or a file-like
+object (anything else is sent as JSON, the way it would be inline). The loop:
+
+- streams it to a spill file, chunk by chunk, so it's never in memory whole
+- memory-maps the spill file for reads
+- puts a size-capped excerpt, the total size and a handle into the conversation
+- gives the model a `read_tool_output(handle, offset)` tool to page through the rest
+
+Small results (under MAX_INLINE_BYTES) still go inline, like before.
+
+    python 11-streamed-tool-outputs.py          # chat against gpt-4o
+    python 11-streamed-tool-outputs.py bench    # peak RSS and request size, inline vs spilled
+"""
+
+import argparse
+import itertools
+import json
+import mmap
+import os
+import subprocess
+import sys
+import tempfile
+from collections.abc import Iterator
+from datetime import date, timedelta
+
+import openai
+
+MAX_INLINE_BYTES = 4096  # largest tool result / page that goes into the conversation
+CHUNK_BYTES = 1 << 16
+
+
+def _utf8_boundary(data, end: int) -> int:
+    """
+    move `end` back so we don't cut a multi-byte character in half
+    """
+    while 0 < end < len(data) and (data[end] & 0xC0) == 0x80:
+        end -= 1
+    return end
+
+
+def _utf8_start(data, offset: int) -> int:
+    """
+    move `offset` forward to the start of a character, for offsets the model made up
+    """
+    while 0 < offset < len(data) and (data[offset] & 0xC0) == 0x80:
+        offset += 1
+    return offset
+
+
+class SpillStore:
+    """
+    large tool results, on disk, memory-mapped, looked up by handle
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or tempfile.mkdtemp(prefix="tool-outputs-")
+        self._outputs = {}
+        self._ids = itertools.count(1)
+
+    def _chunks(self, result):
+        # only iterators and files are streams. a dict or a list is a value
+        # like any other and gets serialized whole
+        if isinstance(result, (str, bytes)):
+            result = [result]
+        elif hasattr(result, "read"):
+            result = self._read_chunks(result)
+        elif not isinstance(result, Iterator):
+            result = [json.dumps(result, default=str)]
+        for chunk in result:
+            yield chunk.encode() if isinstance(chunk, str) else chunk
+
+    @staticmethod
+    def _read_chunks(f):
+        while chunk := f.read(CHUNK_BYTES):
+            yield chunk
+
+    def tool_content(self, result) -> str:
+        """
+        the `content` for a tool message: the result itself if it's small,
+        otherwise an excerpt and a handle to the spill file
+        """
+        head = bytearray()
+        spill = None
+        total = 0
+        for chunk in self._chunks(result):
+            total += len(chunk)
+            if spill is None:
+                head += chunk
+                if len(head) <= MAX_INLINE_BYTES:
+                    continue
+                # too big to inline, everything from here on goes to disk
+                spill = tempfile.NamedTemporaryFile(dir=self.directory, delete=False)
+                spill.write(head)
+                # find the boundary while the bytes after the cut are still there
+                head = head[:_utf8_boundary(head, MAX_INLINE_BYTES)]
+            else:
+                spill.write(chunk)
+
+        if spill is None:
+            return head.decode(errors="replace")
+
+        spill.close()
+        handle = f"out_{next(self._ids)}"
+        with open(spill.name, "rb") as f:
+            self._outputs[handle] = (spill.name, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+        return json.dumps(
+            {
+                "handle": handle,
+                "total_bytes": total,
+                "excerpt": head.decode(errors="replace"),
+                "next_offset": len(head),
+                "note": "this output was too large to include. call read_tool_output "
+                "with the handle and next_offset to read more.",
+            }
+        )
+
+    def read(self, handle: str, offset: int = 0) -> str:
+        if handle not in self._outputs:
+            return json.dumps({"error": f"unknown handle {handle}"})
+        try:
+            offset = int(offset)
+        except (TypeError, ValueError):
+            return json.dumps({"error": f"offset must be an integer, got {offset!r}"})
+        _, data = self._outputs[handle]
+        offset = _utf8_start(data, max(0, min(offset, len(data))))
+        end = _utf8_boundary(data, min(offset + MAX_INLINE_BYTES, len(data)))
+        return json.dumps(
+            {
+                "handle": handle,
+                "offset": offset,
+                "data": data[offset:end].decode(errors="replace"),
+                "next_offset": end if end < len(data) else None,
+                "total_bytes": len(data),
+            }
+        )
+
+    def close(self):
+        for path, data in self._outputs.values():
+            data.close()
+            os.unlink(path)
+        self._outputs.clear()
+        os.rmdir(self.directory)
+
+
+def get_order_history(user_email: str):
+    """
+    get every order a user has ever placed, one JSON object per line
+    """
+    # in reality, a cursor over a big table. a generator, so the caller
+    # decides whether it all ends up in memory
+    return order_history_lines(user_email, n=200_000)
+
+
+def order_history_lines(user_email: str, n: int):
+    start = date(2015, 1, 1)
+    for i in range(n):
+        yield json.dumps(
+            {
+                "order_id": f"{user_email.split('@')[0]}-{i:08d}",
+                "item_name": ["running shorts", "hoodie", "wool socks", "rain jacket"][i % 4],
+                "ordered_on": (start + timedelta(days=i % 3000)).isoformat(),
+                "status": "delivered" if i < n - 3 else "in transit",
+            }
+        ) + "\n"
+
+
+tool_functions = {"get_order_history": get_order_history}
+
+openai_functions = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_order_history",
+            "description": "get every order a user has ever placed, one JSON object per line",
+            "parameters": {
+                "type": "object",
+                "properties": {"user_email": {"type": "string"}},
+                "required": ["user_email"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "read_tool_output",
+            "description": f"read the next {MAX_INLINE_BYTES} bytes of a tool output that was too large to include",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "handle": {"type": "string"},
+                    "offset": {"type": "integer"},
+                },
+                "required": ["handle", "offset"],
+            },
+        },
+    },
+]
+
+
+def run_tool_call(store: SpillStore, tool_call) -> dict:
+    args = json.loads(tool_call.function.arguments)
+    if tool_call.function.name == "read_tool_output":
+        try:
+            content = store.read(**args)
+        except TypeError as e:
+            # missing or extra arguments
+            content = json.dumps({"error": f"bad arguments for read_tool_output: {e}"})
+    elif tool_call.function.name in tool_functions:
+        content = store.tool_content(tool_functions[tool_call.function.name](**args))
+    else:
+        raise ValueError(f"Unknown tool call: {tool_call.function.name}")
+    return {"role": "tool", "tool_call_id": tool_call.id, "content": content}
+
+
+def run_conversation():
+    client = openai.OpenAI()
+    store = SpillStore()
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant. The user is tom@acme-industries.com."},
+        {"role": "user", "content": "What was the first thing I ever ordered?"},
+    ]
+
+    print("\n\n------USER-----\n\n")
+    print(json.dumps(messages[-1]["content"], indent=2))
+
+    try:
+        while True:
+            resp = client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                tools=openai_functions,
+            )
+            messages.append(resp.choices[0].message.model_dump())
+
+            if not resp.choices[0].message.tool_calls:
+                print("\n\n------ASSISTANT-----\n\n")
+                print(json.dumps(messages[-1]["content"], indent=2))
+                print("\n\n------USER-----\n\n> ", end="")
+                try:
+                    user_input = input()
+                except EOFError:
+                    print()
+                    break
+                if user_input == "exit":
+                    break
+                messages.append({"role": "user", "content": user_input})
+                continue
+
+            for tool_call in resp.choices[0].message.tool_calls:
+                print("\n\n------ASSISTANT (tools) -----\n\n")
+                print(f"{tool_call.function.name}({tool_call.function.arguments})")
+                result = run_tool_call(store, tool_call)
+                print(f"\n=> {len(result['content'])} chars")
+                messages.append(result)
+    finally:
+        store.close()
+
+
+# ---------------------------------------------------------------------------
+# benchmark: one turn that calls a tool returning `mb` megabytes, in a fresh
+# process per run so peak RSS means something
+# ---------------------------------------------------------------------------
+
+
+class FakeClient:
+    """
+    calls get_order_history, reads one more page if the result was spilled,
+    then answers. records the size of every request body
+    """
+
+    def __init__(self):
+        self.request_bytes = []
+        self.chat = self
+        self.completions = self
+
+    def create(self, **body):
+        # what the SDK would put on the wire
+        self.request_bytes.append(len(json.dumps(body)))
+        messages = body["messages"]
+        last = messages[-1]
+        if last["role"] == "user":
+            tool_call = ("get_order_history", {"user_email": "tom@acme-industries.com"})
+        elif last["content"].startswith('{"handle"') and len(self.request_bytes) < 3:
+            spilled = json.loads(last["content"])
+            tool_call = ("read_tool_output", {"handle": spilled["handle"], "offset": spilled["next_offset"]})
+        else:
+            tool_call = None
+
+        message = {"role": "assistant", "content": None if tool_call else "Your first order was running shorts."}
+        if tool_call:
+            message["tool_calls"] = [
+                {"id": f"call_{len(self.request_bytes)}", "type": "function",
+                 "function": {"name": tool_call[0], "arguments": json.dumps(tool_call[1])}}
+            ]
+        return openai.types.chat.ChatCompletion.model_validate(
+            {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "fake",
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            }
+        )
+
+
+def max_rss_mib() -> float:
+    import resource
+
+    # kilobytes on linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def bench_one(mode: str, mb: int):
+    line_bytes = len(next(order_history_lines("tom@acme-industries.com", 1)))
+    n = mb * 1024 * 1024 // line_bytes
+    tool_functions["get_order_history"] = lambda user_email: order_history_lines(user_email, n)
+    if mode == "inline":
+        # what the loop did before: the whole result as one string
+        tool_functions["get_order_history"] = lambda user_email: "".join(order_history_lines(user_email, n))
+
+    client = FakeClient()
+    store = SpillStore()
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": "What was the first thing I ever ordered?"},
+    ]
+    # everything imported and warmed up, so the rest is the tool output
+    baseline = max_rss_mib()
+    while True:
+        resp = client.create(model="gpt-4o", messages=messages, tools=openai_functions)
+        messages.append(resp.choices[0].message.model_dump())
+        if not resp.choices[0].message.tool_calls:
+            break
+        for tool_call in resp.choices[0].message.tool_calls:
+            if mode == "inline":
+                args = json.loads(tool_call.function.arguments)
+                content = tool_functions[tool_call.function.name](**args)
+                messages.append({"role": "tool", "tool_call_id": tool_call.id, "content": content})
+            else:
+                messages.append(run_tool_call(store, tool_call))
+    store.close()
+
+    print(json.dumps({"rss_mib": max_rss_mib() - baseline, "request_bytes": max(client.request_bytes)}))
+
+
+def bench(sizes):
+    print(f"{'output':>8}  {'mode':>8}  {'peak RSS growth':>16}  {'largest request':>16}")
+    for mb in sizes:
+        for mode in ["inline", "spill"]:
+            out = subprocess.run(
+                [sys.executable, __file__, "bench-one", mode, str(mb)],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            result = json.loads(out)
+            print(
+                f"{mb:>6}MB  {mode:>8}  {result['rss_mib']:>13.1f}MiB  "
+                f"{result['request_bytes'] / 1024:>13.1f}KiB"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bounded, streamed tool outputs")
+    sub = parser.add_subparsers(dest="command")
+    b = sub.add_parser("bench")
+    b.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 50], help="tool output sizes in MB")
+    one = sub.add_parser("bench-one", help=argparse.SUPPRESS)
+    one.add_argument("mode", choices=["inline", "spill"])
+    one.add_argument("mb", type=int)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.sizes)
+    elif args.command == "bench-one":
+        bench_one(args.mode, args.mb)
+    else:
+        run_conversation()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+send each turn to the cheapest model that can handle it, and escalate when it can't
+
+Every solution so far hard-codes one model for the whole conversation. Most
+turns don't need the big one: turning a tool result into a sentence, or
+answering "thanks!", is easy. Here a router sits in front of the completion call:
+
+- classify_turn() looks at the conversation with cheap local heuristics: is
+  the last message a tool result, small talk, a single lookup, or something
+  that needs planning several tool calls?
+- each class maps to a model tier in ROUTES
+- if a small model answers with an invalid tool call (unknown tool, bad JSON,
+  missing or empty arguments), the turn is retried one tier up. if the top
+  tier gets it wrong too, the error goes back to the model as the tool result
+
+    python 12-model-routing.py          # the chat loop from 05, with routing
+    python 12-model-routing.py bench    # latency and cost on the sessions in recorded-sessions.json
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import time
+import zlib
+from datetime import date, timedelta
+
+import openai
+
+TIERS = ["small", "large"]
+
+# price in $ per 1M tokens, latency as (seconds to first token, seconds per
+# output token). rough public numbers, change them to match what you see
+MODELS = {
+    "small": {"model": "gpt-4o-mini", "input_price": 0.15, "output_price": 0.60, "ttft": 0.35, "per_token": 0.008},
+    "large": {"model": "gpt-4o", "input_price": 2.50, "output_price": 10.00, "ttft": 0.60, "per_token": 0.015},
+}
+
+ROUTES = {
+    "tool_result": "small",
+    "small_talk": "small",
+    "lookup": "small",
+    "planning": "large",
+}
+
+_tracking_re = re.compile(r"\b\d{6,}\b")
+_word_re = re.compile(r"\w+")
+_planning_words = {"and", "then", "also", "compare", "all", "each", "every", "bunch", "both"}
+
+
+def classify_turn(messages: list) -> str:
+    last = messages[-1]
+    if last["role"] == "tool":
+        return "tool_result"
+
+    text = last.get("content") or ""
+    words = [w.lower() for w in _word_re.findall(text)]
+    tracking_numbers = _tracking_re.findall(text)
+    if len(tracking_numbers) > 1 or len(words) > 40 or len(_planning_words.intersection(words)) > 1:
+        return "planning"
+    if len(words) <= 4 and not tracking_numbers:
+        return "small_talk"
+    return "lookup"
+
+
+def get_estimated_delivery_date(tracking_number: str) -> str:
+    """
+    get the estimated delivery date for a package
+    """
+    # deterministic, so replays are repeatable
+    days = zlib.crc32(tracking_number.encode()) % 14 + 1
+    return (date(2024, 5, 1) + timedelta(days=days)).isoformat()
+
+
+tool_functions = {"get_estimated_delivery_date": get_estimated_delivery_date}
+
+openai_functions = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_estimated_delivery_date",
+            "description": "get the estimated delivery date for a package",
+            "parameters": {
+                "type": "object",
+                "properties": {"tracking_number": {"type": "string"}},
+                "required": ["tracking_number"],
+            },
+        },
+    }
+]
+
+_schemas = {f["function"]["name"]: f["function"]["parameters"] for f in openai_functions}
+
+
+def _invalid_call(tool_call) -> str:
+    schema = _schemas.get(tool_call.function.name)
+    if schema is None:
+        return f"unknown tool {tool_call.function.name}"
+    try:
+        args = json.loads(tool_call.function.arguments)
+    except json.JSONDecodeError:
+        return "arguments are not valid JSON"
+    if not isinstance(args, dict):
+        return "arguments are not an object"
+    for name in schema["required"]:
+        if not args.get(name):
+            return f"missing {name}"
+    extra = set(args) - set(schema["properties"])
+    if extra:
+        return f"unexpected arguments {sorted(extra)}"
+    return None
+
+
+def invalid_tool_call(message) -> str:
+    """
+    why the message's tool calls can't be run, or None if they're fine
+    """
+    for tool_call in message.tool_calls or []:
+        error = _invalid_call(tool_call)
+        if error is not None:
+            return error
+    return None
+
+
+def tool_results(message) -> list:
+    """
+    a tool message per tool call. a call that's still invalid after escalating
+    gets the error as its result, so the model can fix it on the next step
+    """
+    results = []
+    for tool_call in message.tool_calls:
+        error = _invalid_call(tool_call)
+        if error is not None:
+            content = f"error: {error}. fix the call and try again"
+        else:
+            args = json.loads(tool_call.function.arguments)
+            content = tool_functions[tool_call.function.name](**args)
+        results.append({"role": "tool", "tool_call_id": tool_call.id, "content": content})
+    return results
+
+
+def routed_completion(client, messages: list, log: list = None, **kwargs):
+    """
+    chat.completions.create, with the model picked by classify_turn() and
+    escalation on invalid tool calls. appends (turn class, tier, error) to `log`
+    """
+    turn = classify_turn(messages)
+    for tier in TIERS[TIERS.index(ROUTES[turn]):]:
+        resp = client.chat.completions.create(
+            model=MODELS[tier]["model"],
+            messages=messages,
+            tools=openai_functions,
+            **kwargs,
+        )
+        error = invalid_tool_call(resp.choices[0].message)
+        if log is not None:
+            log.append((turn, tier, error))
+        if error is None:
+            return resp
+    # the biggest model got it wrong too. tool_results() sends the error back
+    return resp
+
+
+def run_conversation():
+    client = openai.OpenAI()
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": "Where is my shorts delivery?"},
+    ]
+
+    print("\n\n------USER-----\n\n")
+    print(json.dumps(messages[-1]["content"], indent=2))
+
+    while True:
+        log = []
+        resp = routed_completion(client, messages, log)
+        for turn, tier, error in log:
+            print(f"\n[{turn} -> {MODELS[tier]['model']}{', ' + error if error else ''}]")
+        messages.append(resp.choices[0].message.model_dump())
+
+        if not resp.choices[0].message.tool_calls:
+            print("\n\n------ASSISTANT-----\n\n")
+            print(json.dumps(messages[-1]["content"], indent=2))
+            print("\n\n------USER-----\n\n> ", end="")
+            try:
+                user_input = input()
+            except EOFError:
+                print()
+                break
+            if user_input == "exit":
+                break
+            messages.append({"role": "user", "content": user_input})
+            continue
+
+        for tool_call, result in zip(resp.choices[0].message.tool_calls, tool_results(resp.choices[0].message)):
+            print("\n\n------ASSISTANT (tools) -----\n\n")
+            print(f"{tool_call.function.name}({tool_call.function.arguments}) => {result['content']}")
+            messages.append(result)
+
+
+# ---------------------------------------------------------------------------
+# benchmark: replay recorded-sessions.json. the recordings are what the large
+# model said; the small model says the same thing, except that with
+# probability SMALL_ERROR_RATES[turn class] its tool call comes out broken.
+# that means routing has no quality cost here by construction, only the
+# latency and dollars are being measured
+# ---------------------------------------------------------------------------
+
+SESSIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recorded-sessions.json")
+
+SMALL_ERROR_RATES = {"tool_result": 0.01, "small_talk": 0.0, "lookup": 0.05, "planning": 0.3}
+
+
+def estimate_tokens(value) -> int:
+    return len(json.dumps(value, default=str)) // 4 + 1
+
+
+class ReplayClient:
+    """
+    plays back a recorded session, adding up what each call would have cost
+    """
+
+    def __init__(self, responses: list, rng: random.Random):
+        self.responses = iter(responses)
+        self.rng = rng
+        self.pending = None
+        self.seconds = 0.0
+        self.dollars = 0.0
+        self.chat = self
+        self.completions = self
+
+    def create(self, model, messages, **kwargs):
+        tier = next(t for t, m in MODELS.items() if m["model"] == model)
+        if self.pending is None:
+            self.pending = next(self.responses)
+        recorded = json.loads(json.dumps(self.pending))
+        message = recorded["choices"][0]["message"]
+
+        if tier == "small" and message.get("tool_calls"):
+            turn = classify_turn(messages)
+            if self.rng.random() < SMALL_ERROR_RATES[turn]:
+                message["tool_calls"][0]["function"]["arguments"] = self.rng.choice(
+                    ['{"tracking_number": ""}', '{"tracking_number": 8675309', '{"package": "8675309"}']
+                )
+
+        input_tokens = estimate_tokens({"messages": messages, "tools": openai_functions})
+        output_tokens = estimate_tokens(message)
+        spec = MODELS[tier]
+        self.seconds += spec["ttft"] + spec["per_token"] * output_tokens
+        self.dollars += (input_tokens * spec["input_price"] + output_tokens * spec["output_price"]) / 1e6
+
+        resp = openai.types.chat.ChatCompletion.model_validate(recorded)
+        if invalid_tool_call(resp.choices[0].message) is None:
+            # this recorded turn is done, the next call gets the next one
+            self.pending = None
+        return resp
+
+
+def replay(session: dict, client, route: bool, log: list):
+    messages = [dict(m) for m in session["messages"]]
+    user_inputs = iter(session["user_inputs"])
+
+    while True:
+        if route:
+            resp = routed_completion(client, messages, log)
+        else:
+            resp = client.chat.completions.create(model=MODELS["large"]["model"], messages=messages, tools=openai_functions)
+            log.append((classify_turn(messages), "large", None))
+        messages.append(resp.choices[0].message.model_dump())
+
+        if not resp.choices[0].message.tool_calls:
+            user_input = next(user_inputs, None)
+            if user_input is None:
+                return
+            messages.append({"role": "user", "content": user_input})
+            continue
+
+        messages.extend(tool_results(resp.choices[0].message))
+
+
+def bench(repeats: int):
+    with open(SESSIONS_PATH) as f:
+        sessions = json.load(f)
+
+    print(f"{len(sessions)} recorded sessions, each replayed {repeats} times")
+    print(f"small model tool-call error rates: {SMALL_ERROR_RATES}\n")
+    print(f"{'session':<18}{'':>8}{'model time':>12}{'cost':>12}{'calls':>7}{'escalated':>11}")
+
+    totals = {False: [0.0, 0.0], True: [0.0, 0.0]}
+    classes = {}
+    classify_seconds = 0.0
+    for session in sessions:
+        for route in (False, True):
+            seconds = dollars = 0.0
+            log = []
+            for i in range(repeats):
+                client = ReplayClient(session["responses"], random.Random(i))
+                replay(session, client, route, log)
+                seconds += client.seconds
+                dollars += client.dollars
+            totals[route][0] += seconds
+            totals[route][1] += dollars
+            escalated = sum(1 for _, _, error in log if error)
+            label = "routed" if route else "gpt-4o"
+            print(
+                f"{session['name'] if not route else '':<18}{label:>8}{seconds / repeats:>11.2f}s"
+                f"{dollars / repeats * 1000:>10.3f}m$"
+                f"{len(log) / repeats:>7.1f}{escalated / repeats:>11.2f}"
+            )
+            if route:
+                for turn, tier, error in log:
+                    classes.setdefault(turn, {"small": 0, "large": 0})[tier] += 1
+
+        # how long the router itself takes
+        messages = [dict(m) for m in session["messages"]]
+        start = time.perf_counter()
+        for _ in range(repeats):
+            classify_turn(messages)
+        classify_seconds += (time.perf_counter() - start) / repeats
+
+    print("\ncalls by turn class:", ", ".join(f"{turn} {counts}" for turn, counts in sorted(classes.items())))
+    (base_s, base_d), (routed_s, routed_d) = totals[False], totals[True]
+    print(f"model time   {base_s / repeats:.2f}s -> {routed_s / repeats:.2f}s ({1 - routed_s / base_s:.0%} less)")
+    print(f"cost         {base_d / repeats * 1000:.3f}m$ -> {routed_d / repeats * 1000:.3f}m$ ({1 - routed_d / base_d:.0%} less)")
+    print(f"classify     {classify_seconds / len(sessions) * 1e6:.1f}us per turn")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="adaptive model routing")
+    sub = parser.add_subparsers(dest="command")
+    b = sub.add_parser("bench")
+    b.add_argument("--repeats", type=int, default=200, help="replays per session, each with different small-model errors")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.repeats)
+    else:
+        run_conversation()
+
+
+if __name__ == "__main__":
+    main()
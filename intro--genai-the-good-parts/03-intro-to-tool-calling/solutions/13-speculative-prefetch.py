@@ -0,0 +1,294 @@
+"""
+start the tool call before the model asks for it
+
+When the user says "the tracking number is 8675309", we already know what's
+coming: the model will call get_estimated_delivery_date("8675309"). But the
+loop in 05-exercise-parallel-tool-calls only starts the lookup once the model's
+response arrives, so every such turn waits for a model call *and then* a tool call.
+
+Here, each new user message is scanned with a declarative pattern per tool (a
+regex whose named groups are the tool's arguments). Every match starts that
+tool call in the background, and its result goes into a short-lived cache.
+When the model does ask for it, the dispatcher takes the result from the cache
+(waiting for it if it's still running). Prefetches nobody asks for expire.
+
+Only put read-only tools in PREFETCH_PATTERNS. A speculative "cancel my order"
+is not a thing you can take back.
+
+    python 13-speculative-prefetch.py          # chat against gpt-4o, with prefetching
+    python 13-speculative-prefetch.py bench    # hit rate and turn latency on the sessions in recorded-sessions.json
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import openai
+
+PREFETCH_TTL = 30.0  # seconds a prefetched result is kept waiting for the model
+TOOL_LATENCY = 0.3  # seconds, how slow our pretend shipping backend is
+
+
+def get_estimated_delivery_date(tracking_number: str) -> str:
+    """
+    get the estimated delivery date for a package
+    """
+    # in reality, a call to a shipping backend that takes a moment
+    time.sleep(TOOL_LATENCY)
+    days = zlib.crc32(tracking_number.encode()) % 14 + 1
+    return (date(2024, 5, 1) + timedelta(days=days)).isoformat()
+
+
+tool_functions = {"get_estimated_delivery_date": get_estimated_delivery_date}
+
+# tool name -> patterns. each named group becomes an argument
+PREFETCH_PATTERNS = {
+    "get_estimated_delivery_date": [
+        re.compile(r"\b(?P<tracking_number>\d{6,})\b"),
+    ],
+}
+
+openai_functions = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_estimated_delivery_date",
+            "description": "get the estimated delivery date for a package",
+            "parameters": {
+                "type": "object",
+                "properties": {"tracking_number": {"type": "string"}},
+                "required": ["tracking_number"],
+            },
+        },
+    }
+]
+
+
+def _key(name: str, args: dict) -> str:
+    return name + json.dumps(args, sort_keys=True)
+
+
+class Prefetcher:
+    def __init__(self, ttl: float = PREFETCH_TTL, max_workers: int = 8):
+        self.ttl = ttl
+        self._pool = ThreadPoolExecutor(max_workers)
+        self._cache = {}  # key -> (future, expires_at)
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+
+    def scan(self, text: str):
+        """
+        start every tool call `text` suggests, unless it's already running
+        """
+        self.expire()
+        now = time.monotonic()
+        for name, patterns in PREFETCH_PATTERNS.items():
+            for pattern in patterns:
+                for match in pattern.finditer(text):
+                    args = match.groupdict()
+                    key = _key(name, args)
+                    if key in self._cache:
+                        continue
+                    self._cache[key] = (self._pool.submit(tool_functions[name], **args), now + self.ttl)
+                    self.started += 1
+
+    def take(self, name: str, args: dict):
+        """
+        the prefetched future for this call, or None. each result is used once,
+        a second identical call runs the tool again
+        """
+        entry = self._cache.pop(_key(name, args), None)
+        if entry is None or entry[1] < time.monotonic():
+            self.misses += 1
+            if entry is not None:
+                self.wasted += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def expire(self):
+        now = time.monotonic()
+        for key, (future, expires_at) in list(self._cache.items()):
+            if expires_at < now:
+                # already-running calls finish, we just stop keeping the result
+                future.cancel()
+                del self._cache[key]
+                self.wasted += 1
+
+    def close(self):
+        self.wasted += len(self._cache)
+        self._cache.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_tool_call(prefetcher: Prefetcher, tool_call) -> dict:
+    func = tool_functions.get(tool_call.function.name)
+    if func is None:
+        raise ValueError(f"Unknown tool call: {tool_call.function.name}")
+    args = json.loads(tool_call.function.arguments)
+
+    future = prefetcher.take(tool_call.function.name, args)
+    result = future.result() if future is not None else func(**args)
+    return {"role": "tool", "tool_call_id": tool_call.id, "content": result}
+
+
+def run_conversation():
+    client = openai.OpenAI()
+    prefetcher = Prefetcher()
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": "Where is my shorts delivery? The tracking number is 8675309"},
+    ]
+
+    print("\n\n------USER-----\n\n")
+    print(json.dumps(messages[-1]["content"], indent=2))
+    prefetcher.scan(messages[-1]["content"])
+    turn_start = time.perf_counter()
+
+    try:
+        while True:
+            resp = client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                tools=openai_functions,
+            )
+            messages.append(resp.choices[0].message.model_dump())
+
+            if not resp.choices[0].message.tool_calls:
+                print(f"\n\n------ASSISTANT ({time.perf_counter() - turn_start:.2f}s, "
+                      f"prefetch hits {prefetcher.hits}/{prefetcher.hits + prefetcher.misses})-----\n\n")
+                print(json.dumps(messages[-1]["content"], indent=2))
+                print("\n\n------USER-----\n\n> ", end="")
+                try:
+                    user_input = input()
+                except EOFError:
+                    print()
+                    break
+                if user_input == "exit":
+                    break
+                messages.append({"role": "user", "content": user_input})
+                # runs while we wait for the model
+                prefetcher.scan(user_input)
+                turn_start = time.perf_counter()
+                continue
+
+            for tool_call in resp.choices[0].message.tool_calls:
+                print("\n\n------ASSISTANT (tools) -----\n\n")
+                print(f"{tool_call.function.name}({tool_call.function.arguments})")
+                messages.append(run_tool_call(prefetcher, tool_call))
+    finally:
+        prefetcher.close()
+
+
+# ---------------------------------------------------------------------------
+# benchmark: replay recorded-sessions.json (the one copy of the recordings,
+# also replayed by 12-model-routing.py and scripts/bench_sessions.py) with a
+# model that takes `latency` seconds per call and a tool that takes TOOL_LATENCY
+# ---------------------------------------------------------------------------
+
+SESSIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recorded-sessions.json")
+
+
+class ReplayClient:
+    def __init__(self, responses: list, latency: float):
+        self.responses = iter(responses)
+        self.latency = latency
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        time.sleep(self.latency)
+        return openai.types.chat.ChatCompletion.model_validate(next(self.responses))
+
+
+def replay(session: dict, latency: float, prefetch: bool):
+    """
+    returns (seconds per user turn, prefetcher)
+    """
+    client = ReplayClient(session["responses"], latency)
+    prefetcher = Prefetcher()
+    messages = [dict(m) for m in session["messages"]]
+    user_inputs = iter(session["user_inputs"])
+    turns = []
+
+    if prefetch:
+        prefetcher.scan(messages[-1]["content"])
+    start = time.perf_counter()
+    while True:
+        resp = client.chat.completions.create(model="gpt-4o", messages=messages, tools=openai_functions)
+        messages.append(resp.choices[0].message.model_dump())
+
+        if not resp.choices[0].message.tool_calls:
+            turns.append(time.perf_counter() - start)
+            user_input = next(user_inputs, None)
+            if user_input is None:
+                break
+            messages.append({"role": "user", "content": user_input})
+            if prefetch:
+                prefetcher.scan(user_input)
+            start = time.perf_counter()
+            continue
+
+        for tool_call in resp.choices[0].message.tool_calls:
+            messages.append(run_tool_call(prefetcher, tool_call))
+
+    prefetcher.close()
+    return turns, prefetcher
+
+
+def bench(latency: float, tool_latency: float):
+    global TOOL_LATENCY
+    TOOL_LATENCY = tool_latency
+
+    with open(SESSIONS_PATH) as f:
+        sessions = json.load(f)
+
+    print(f"model {latency * 1000:.0f}ms per call, tool {tool_latency * 1000:.0f}ms per call\n")
+    print(f"{'session':<18}{'turns':>6}{'without':>12}{'with':>12}{'saved':>8}{'hits':>8}{'wasted':>8}")
+    totals = [0.0, 0.0, 0, 0, 0]
+    for session in sessions:
+        without, _ = replay(session, latency, prefetch=False)
+        with_prefetch, prefetcher = replay(session, latency, prefetch=True)
+        calls = prefetcher.hits + prefetcher.misses
+        print(
+            f"{session['name']:<18}{len(without):>6}"
+            f"{sum(without) / len(without) * 1000:>10.0f}ms{sum(with_prefetch) / len(with_prefetch) * 1000:>10.0f}ms"
+            f"{1 - sum(with_prefetch) / sum(without):>8.0%}"
+            f"{prefetcher.hits:>4}/{calls:<3}{prefetcher.wasted:>8}"
+        )
+        totals[0] += sum(without)
+        totals[1] += sum(with_prefetch)
+        totals[2] += prefetcher.hits
+        totals[3] += calls
+        totals[4] += prefetcher.wasted
+
+    without, with_prefetch, hits, calls, wasted = totals
+    print(
+        f"\nhit rate {hits / calls:.0%} of tool calls, {wasted} prefetches unused, "
+        f"turn time {without:.2f}s -> {with_prefetch:.2f}s ({1 - with_prefetch / without:.0%} less)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="speculative tool prefetching")
+    sub = parser.add_subparsers(dest="command")
+    b = sub.add_parser("bench")
+    b.add_argument("--latency", type=float, default=0.5, help="seconds per model call")
+    b.add_argument("--tool-latency", type=float, default=0.3, help="seconds per tool call")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.latency, args.tool_latency)
+    else:
+        run_conversation()
+
+
+if __name__ == "__main__":
+    main()
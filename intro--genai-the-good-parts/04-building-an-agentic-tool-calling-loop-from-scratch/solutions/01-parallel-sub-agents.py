@@ -0,0 +1,379 @@
+"""
+fan a compound question out to sub-agents that each run their own tool loop, concurrently
+
+"where are my shorts, my hoodie and my socks?" needs a search_orders call and a
+get_estimated_delivery_date call *per item*. A model that makes one tool call
+per step does them one at a time, dragging a longer and longer history through
+every call. (A model that batches independent calls into one step doesn't have
+that problem, see the bench.)
+
+Here the top-level agent gets one tool, `delegate`. When it calls it with a list
+of tasks, we start a sub-agent per task. Each one has:
+
+- a scoped tool set (only the order tools, no delegate)
+- its own short history: its instructions and its one task, nothing else
+- a job to report back in a sentence
+
+They run at once (up to MAX_CONCURRENT_SUB_AGENTS at a time), and their
+condensed answers go back to the parent as the result of the `delegate` call. A
+sub-agent that fails becomes an error entry in that result rather than failing
+the whole delegate call. A `delegate` call with something other than a list of
+at most MAX_TASKS strings gets an error back instead of any sub-agents.
+
+    python 01-parallel-sub-agents.py          # run it against gpt-4o
+    python 01-parallel-sub-agents.py bench    # latency vs a single loop, on 1 to 6 item questions
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import re
+import time
+from datetime import datetime, timedelta
+from random import randint
+
+import openai
+
+USER_EMAIL = "tom@acme-industries.com"
+
+MAX_TASKS = 8  # per delegate call, the model decides how many it asks for
+MAX_CONCURRENT_SUB_AGENTS = 4  # across all delegate calls in one answer
+
+ORDERS = {
+    USER_EMAIL: [
+        {"tracking_number": "8675309", "item_name": "running shorts"},
+        {"tracking_number": "1234567", "item_name": "hoodie"},
+        {"tracking_number": "2468101", "item_name": "wool socks"},
+        {"tracking_number": "1357911", "item_name": "rain jacket"},
+        {"tracking_number": "1122334", "item_name": "trail shoes"},
+        {"tracking_number": "5566778", "item_name": "water bottle"},
+    ],
+}
+
+
+def search_orders(user_email: str, item_name: str) -> str:
+    """
+    search a user's orders by item name, returns matching orders with their tracking numbers
+    """
+    matches = [
+        order
+        for order in ORDERS.get(user_email, [])
+        if item_name.lower() in order["item_name"].lower()
+    ]
+    return json.dumps(matches)
+
+
+def get_estimated_delivery_date(tracking_number: str) -> str:
+    """
+    get the estimated delivery date for a package
+    """
+    return (datetime.now() + timedelta(days=randint(1, 14))).isoformat()
+
+
+order_tools = {
+    "search_orders": search_orders,
+    "get_estimated_delivery_date": get_estimated_delivery_date,
+}
+
+order_tool_schemas = [
+    {
+        "type": "function",
+        "function": {
+            "name": "search_orders",
+            "description": "search a user's orders by item name, returns matching orders with their tracking numbers",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "user_email": {"type": "string"},
+                    "item_name": {"type": "string"},
+                },
+                "required": ["user_email", "item_name"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_estimated_delivery_date",
+            "description": "get the estimated delivery date for a package",
+            "parameters": {
+                "type": "object",
+                "properties": {"tracking_number": {"type": "string"}},
+                "required": ["tracking_number"],
+            },
+        },
+    },
+]
+
+delegate_schema = {
+    "type": "function",
+    "function": {
+        "name": "delegate",
+        "description": "hand off independent tasks to helpers that run at the same time. "
+        "each task should be self-contained, e.g. 'find the estimated delivery date for the hoodie'",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "tasks": {"type": "array", "items": {"type": "string"}, "maxItems": MAX_TASKS},
+            },
+            "required": ["tasks"],
+        },
+    },
+}
+
+system_prompt = f"""
+you are a helpful assistant
+
+the user your are assisting is: {USER_EMAIL}
+"""
+
+planner_prompt = system_prompt + """
+when a question has several independent parts, call `delegate` once with one task per part
+"""
+
+sub_agent_prompt = system_prompt + """
+you are helping with one small task. use the tools to do it, then reply with a single
+sentence that answers it. no greetings, no follow-up questions.
+"""
+
+
+async def run_tool_loop(client, messages: list, tools: dict, schemas: list, model: str, max_iterations: int = 10):
+    """
+    the loop from chapter 3, with every tool call in a message run concurrently
+    """
+    for _ in range(max_iterations):
+        resp = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            tools=schemas,
+        )
+        message = resp.choices[0].message
+        messages.append(message.model_dump())
+        if not message.tool_calls:
+            return message.content
+
+        async def call(tool_call):
+            func = tools.get(tool_call.function.name)
+            if func is None:
+                raise ValueError(f"Unknown tool call: {tool_call.function.name}")
+            result = func(**json.loads(tool_call.function.arguments))
+            if asyncio.iscoroutine(result):
+                result = await result
+            return {"role": "tool", "tool_call_id": tool_call.id, "content": result}
+
+        messages.extend(await asyncio.gather(*(call(tc) for tc in message.tool_calls)))
+
+    raise RuntimeError(f"no answer after {max_iterations} iterations")
+
+
+async def run_sub_agent(client, task: str, model: str) -> dict:
+    messages = [
+        {"role": "system", "content": sub_agent_prompt},
+        {"role": "user", "content": task},
+    ]
+    result = await run_tool_loop(client, messages, order_tools, order_tool_schemas, model)
+    return {"task": task, "result": result}
+
+
+async def answer_with_sub_agents(client, messages: list, model: str = "gpt-4o", sub_agent_model: str = "gpt-4o-mini"):
+    slots = asyncio.Semaphore(MAX_CONCURRENT_SUB_AGENTS)
+
+    async def run_limited(task: str) -> dict:
+        async with slots:
+            return await run_sub_agent(client, task, sub_agent_model)
+
+    async def delegate(tasks: list) -> str:
+        # the arguments come from the model, so check them before starting
+        # anything. an error here goes back to it as the tool result
+        if not isinstance(tasks, list) or not all(isinstance(task, str) for task in tasks):
+            return json.dumps({"error": "tasks must be a list of strings"})
+        if len(tasks) > MAX_TASKS:
+            return json.dumps({"error": f"at most {MAX_TASKS} tasks per delegate call, got {len(tasks)}"})
+
+        results = await asyncio.gather(
+            *(run_limited(task) for task in tasks),
+            return_exceptions=True,
+        )
+        # one failed sub-agent shouldn't throw away the others' answers, the
+        # planner gets an error entry for it and can say so
+        results = [
+            {"task": task, "error": f"{type(result).__name__}: {result}"}
+            if isinstance(result, Exception) else result
+            for task, result in zip(tasks, results)
+        ]
+        # only the condensed answers go into the parent's history, not the
+        # sub-agents' tool calls
+        return json.dumps(results)
+
+    return await run_tool_loop(client, messages, {"delegate": delegate}, [delegate_schema], model)
+
+
+async def answer_with_single_loop(client, messages: list, model: str = "gpt-4o"):
+    return await run_tool_loop(client, messages, order_tools, order_tool_schemas, model, max_iterations=30)
+
+
+async def run_conversation():
+    client = openai.AsyncOpenAI()
+    messages = [
+        {"role": "system", "content": planner_prompt},
+        {"role": "user", "content": "Where are my shorts, my hoodie and my socks?"},
+    ]
+
+    print("\n\n------USER-----\n\n")
+    print(messages[-1]["content"])
+
+    content = await answer_with_sub_agents(client, messages)
+
+    for message in messages:
+        if message.get("role") == "tool":
+            print("\n\n------SUB-AGENTS-----\n\n")
+            print(json.dumps(json.loads(message["content"]), indent=2))
+
+    print("\n\n------ASSISTANT-----\n\n")
+    print(content)
+
+
+# ---------------------------------------------------------------------------
+# benchmark: a fake model whose latency grows with the size of the request.
+# with parallel_tool_calls=False it makes one tool call per step, the worst
+# case for a single loop. with True it batches every call it can make at once
+# (all the searches, then all the lookups), the best case
+# ---------------------------------------------------------------------------
+
+
+class FakeAsyncClient:
+    def __init__(self, base_latency: float, latency_per_kb: float, parallel_tool_calls: bool = False):
+        self.base_latency = base_latency
+        self.latency_per_kb = latency_per_kb
+        self.parallel_tool_calls = parallel_tool_calls
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    async def create(self, model, messages, tools, **kwargs):
+        self.calls += 1
+        request_kb = len(json.dumps({"messages": messages, "tools": tools})) / 1024
+        await asyncio.sleep(self.base_latency + self.latency_per_kb * request_kb)
+
+        if tools[0]["function"]["name"] == "delegate":
+            if messages[-1]["role"] == "user":
+                items = requested_items(messages[-1]["content"])
+                return fake_completion(
+                    tool_calls=[("delegate", {"tasks": [f"find the estimated delivery date for the {i}" for i in items]})]
+                )
+            return fake_completion(content="Here's where everything is.")
+
+        user_message = next(m["content"] for m in messages if m["role"] == "user")
+        calls = [
+            (tc["function"]["name"], json.loads(tc["function"]["arguments"]))
+            for m in messages
+            if m.get("role") == "assistant"
+            for tc in m.get("tool_calls") or []
+        ]
+        searched = {args["item_name"] for name, args in calls if name == "search_orders"}
+        looked_up = {args["tracking_number"] for name, args in calls if name == "get_estimated_delivery_date"}
+        found = [
+            order["tracking_number"]
+            for m in messages
+            if m.get("role") == "tool" and m["content"].startswith("[")
+            for order in json.loads(m["content"])
+        ]
+
+        searches = [
+            ("search_orders", {"user_email": USER_EMAIL, "item_name": item})
+            for item in requested_items(user_message)
+            if item not in searched
+        ]
+        lookups = [
+            ("get_estimated_delivery_date", {"tracking_number": tracking_number})
+            for tracking_number in found
+            if tracking_number not in looked_up
+        ]
+        for pending in (searches, lookups):
+            if pending:
+                return fake_completion(tool_calls=pending if self.parallel_tool_calls else pending[:1])
+        return fake_completion(content="It should arrive soon.")
+
+
+def requested_items(text: str) -> list:
+    words = re.findall(r"\w+", text.lower())
+    items = []
+    for order in ORDERS[USER_EMAIL]:
+        name = order["item_name"].split()[-1]
+        if name in words or name + "s" in words:
+            items.append(name)
+    return items
+
+
+_call_ids = itertools.count()
+
+
+def fake_completion(content=None, tool_calls=()):
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = [
+            {"id": f"call_{next(_call_ids)}", "type": "function",
+             "function": {"name": name, "arguments": json.dumps(args)}}
+            for name, args in tool_calls
+        ]
+    return openai.types.chat.ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "fake",
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+        }
+    )
+
+
+async def bench(base_latency: float, latency_per_kb: float):
+    questions = [
+        "Where are my shorts?",
+        "Where are my shorts and my hoodie?",
+        "Where are my shorts, my hoodie and my socks?",
+        "Where are my shorts, hoodie, socks and jacket?",
+        "Where are my shorts, hoodie, socks, jacket and shoes?",
+        "Where are my shorts, hoodie, socks, jacket, shoes and bottle?",
+    ]
+    runs = [
+        (system_prompt, answer_with_single_loop, False),
+        (system_prompt, answer_with_single_loop, True),
+        (planner_prompt, answer_with_sub_agents, False),
+    ]
+    print(f"model latency: {base_latency * 1000:.0f}ms + {latency_per_kb * 1000:.0f}ms per KB of request")
+    print("single loop: one tool call per step (worst case) and all independent calls batched (best case)\n")
+    print(f"{'items':>5}  {'single, one per step':>22}  {'single, batched':>22}  {'sub-agents':>22}  {'speedup vs each':>16}")
+    for question in questions:
+        row = []
+        for prompt, answer, parallel_tool_calls in runs:
+            client = FakeAsyncClient(base_latency, latency_per_kb, parallel_tool_calls)
+            messages = [{"role": "system", "content": prompt}, {"role": "user", "content": question}]
+            start = time.perf_counter()
+            await answer(client, messages)
+            row.append((time.perf_counter() - start, client.calls))
+        (one, one_calls), (batched, batched_calls), (fanned, fanned_calls) = row
+        print(
+            f"{len(requested_items(question)):>5}  {one:8.2f}s ({one_calls:2d} calls)  "
+            f"{batched:8.2f}s ({batched_calls:2d} calls)  {fanned:8.2f}s ({fanned_calls:2d} calls)  "
+            f"{one / fanned:9.1f}x/{batched / fanned:4.1f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="parallel sub-agents for compound questions")
+    sub = parser.add_subparsers(dest="command")
+    b = sub.add_parser("bench")
+    b.add_argument("--base-latency", type=float, default=0.4, help="seconds per model call")
+    b.add_argument("--latency-per-kb", type=float, default=0.02, help="extra seconds per KB sent")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        asyncio.run(bench(args.base_latency, args.latency_per_kb))
+    else:
+        asyncio.run(run_conversation())
+
+
+if __name__ == "__main__":
+    main()
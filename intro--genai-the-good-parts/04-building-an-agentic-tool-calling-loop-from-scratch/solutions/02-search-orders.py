@@ -0,0 +1,430 @@
+"""
+a real search_orders: SQLite, indexed, with full-text and fuzzy item search
+
+The user says "my shorts", not a tracking number, so the model calls
+search_orders(user_email, item_name). Behind it:
+
+- an `orders` table with a composite (user_email, created_at) index, so a
+  user's orders come back newest-first without touching anyone else's
+- an FTS5 index over item names (porter stemming, so "shorts" finds "short",
+  and every term is a prefix query, so "hood" finds "hoodie"). every word is
+  indexed with the user in front of it, "u1a2b..._shorts", so a lookup only
+  reads that user's "shorts", not the 500k other ones in the table
+- a fuzzy fallback for typos ("hoddie"): the user's most recent orders by the
+  composite index, ranked by how close their words are to the query
+- results capped at MAX_RESULTS, newest first within equally good matches
+
+    python 02-search-orders.py generate --orders 10000000 --db orders.db
+    python 02-search-orders.py search tom@acme-industries.com "running shorts" --db orders.db
+    python 02-search-orders.py bench --sizes 10000 100000 1000000    # p50/p99 as the data grows
+    python 02-search-orders.py --db orders.db                         # chat against gpt-4o
+"""
+
+import argparse
+import difflib
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+MAX_RESULTS = 20
+FUZZY_SCAN = 500  # most recent orders checked when nothing matches exactly
+FUZZY_CUTOFF = 0.75
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    user_email TEXT NOT NULL,
+    item_name TEXT NOT NULL,
+    tracking_number TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS orders_fts USING fts5(
+    terms,
+    content='',
+    tokenize="porter unicode61 tokenchars '_'"
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS orders_user_created ON orders (user_email, created_at);
+"""
+
+_word_re = re.compile(r"\w+")
+
+
+def normalize_email(user_email: str) -> str:
+    """
+    the form emails are stored and looked up in, so "Tom@Acme..." finds tom's orders
+    """
+    return user_email.strip().lower()
+
+
+def owner_prefix(user_email: str) -> str:
+    # expects a normalized email
+    return "u" + hashlib.sha1(user_email.encode()).hexdigest()[:16] + "_"
+
+
+def fts_terms(user_email: str, item_name: str) -> str:
+    """
+    the item's words, each scoped to its user. (FTS5 would happily AND an
+    owner token with "shorts", but it does that by walking every "shorts" row)
+    """
+    prefix = owner_prefix(user_email)
+    return " ".join(prefix + word for word in _word_re.findall(item_name.lower()))
+
+
+def connect(path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+
+def add_orders(db: sqlite3.Connection, orders):
+    """
+    orders are (user_email, item_name, tracking_number, status, created_at)
+    """
+    for user_email, *rest in orders:
+        user_email = normalize_email(user_email)
+        cursor = db.execute(
+            "INSERT INTO orders (user_email, item_name, tracking_number, status, created_at) VALUES (?, ?, ?, ?, ?)",
+            (user_email, *rest),
+        )
+        db.execute(
+            "INSERT INTO orders_fts (rowid, terms) VALUES (?, ?)",
+            (cursor.lastrowid, fts_terms(user_email, rest[0])),
+        )
+    db.executescript(INDEXES)
+    db.commit()
+
+
+def _fts_query(user_email: str, words: list, operator: str) -> str:
+    prefix = owner_prefix(user_email)
+    return f" {operator} ".join(f'"{prefix}{word}"*' for word in words)
+
+
+def _rows(rows) -> list:
+    return [
+        {
+            "tracking_number": row["tracking_number"],
+            "item_name": row["item_name"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+        }
+        for row in rows
+    ]
+
+
+def search(db: sqlite3.Connection, user_email: str, item_name: str, limit: int = MAX_RESULTS) -> list:
+    limit = max(1, min(limit, MAX_RESULTS))
+    user_email = normalize_email(user_email)
+    words = [w.lower() for w in _word_re.findall(item_name)]
+    if not words:
+        return []
+
+    # every word, then any word. the user_email check costs next to nothing
+    # (one row by primary key per match) and means a prefix collision, or a row
+    # indexed under the wrong user, can't show up in someone else's results
+    for operator in ("AND", "OR"):
+        rows = db.execute(
+            """
+            SELECT o.tracking_number, o.item_name, o.status, o.created_at
+            FROM orders_fts f JOIN orders o ON o.id = f.rowid
+            WHERE orders_fts MATCH ? AND o.user_email = ?
+            ORDER BY bm25(orders_fts), o.created_at DESC
+            LIMIT ?
+            """,
+            (_fts_query(user_email, words, operator), user_email, limit),
+        ).fetchall()
+        if rows:
+            return _rows(rows)
+        if len(words) == 1:
+            break
+
+    # nothing matched, probably a typo. check the user's recent orders by hand
+    recent = db.execute(
+        """
+        SELECT tracking_number, item_name, status, created_at
+        FROM orders WHERE user_email = ?
+        ORDER BY created_at DESC
+        LIMIT ?
+        """,
+        (user_email, FUZZY_SCAN),
+    ).fetchall()
+    scored = []
+    for row in recent:
+        item_words = _word_re.findall(row["item_name"].lower())
+        score = sum(
+            max(difflib.SequenceMatcher(None, word, item_word).ratio() for item_word in item_words)
+            for word in words
+        ) / len(words)
+        if score >= FUZZY_CUTOFF:
+            scored.append((score, row))
+    # sorted() is stable, so equally close matches stay newest first
+    scored = sorted(scored, key=lambda pair: -pair[0])
+    return _rows(row for _, row in scored[:limit])
+
+
+db = None
+
+
+def search_orders(user_email: str, item_name: str) -> str:
+    """
+    search a user's orders by item name, returns matching orders with their tracking numbers, newest first
+    """
+    return json.dumps(search(db, user_email, item_name))
+
+
+# ---------------------------------------------------------------------------
+# test data
+# ---------------------------------------------------------------------------
+
+ADJECTIVES = [
+    "running", "wool", "rain", "trail", "denim", "cotton", "fleece", "leather",
+    "linen", "cargo", "hiking", "waterproof", "thermal", "yoga", "winter",
+]
+NOUNS = [
+    "shorts", "hoodie", "socks", "jacket", "shoes", "bottle", "backpack", "hat",
+    "gloves", "shirt", "pants", "sweater", "scarf", "boots", "vest", "leggings",
+    "tent", "blanket", "mug", "belt",
+]
+STATUSES = ["processing", "shipped", "in transit", "out for delivery", "delivered"]
+
+
+def generate_orders(n: int, seed: int = 0):
+    """
+    n orders from n // 10 users. activity is skewed, so a few users have
+    thousands of orders and most have a handful. tom always has some shorts.
+    """
+    rng = random.Random(seed)
+    users = max(1, n // 10)
+    start = datetime(2020, 1, 1)
+    span = 5 * 365 * 24 * 3600
+    emails = ["tom@acme-industries.com"] + [f"user{i}@example.com" for i in range(1, users)]
+    for i in range(n):
+        user = emails[int(users * rng.random() ** 2)]
+        item = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
+        if user == emails[0] and i % 7 == 0:
+            item = "running shorts"
+        created = start + timedelta(seconds=rng.randrange(span))
+        yield (user, item, f"{i:010d}", rng.choice(STATUSES), created.isoformat(timespec="seconds"))
+
+
+def build_db(path: str, n: int, seed: int = 0, batch: int = 100_000):
+    """
+    bulk load: no journal, rows first, indexes after
+    """
+    if os.path.exists(path):
+        os.unlink(path)
+    db = connect(path)
+    db.execute("PRAGMA journal_mode = OFF")
+    db.execute("PRAGMA synchronous = OFF")
+    orders = generate_orders(n, seed)
+    next_id = 1
+    while True:
+        chunk = [(normalize_email(email), *rest) for _, (email, *rest) in zip(range(batch), orders)]
+        if not chunk:
+            break
+        ids = range(next_id, next_id + len(chunk))
+        db.executemany(
+            "INSERT INTO orders (id, user_email, item_name, tracking_number, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            ((i, *order) for i, order in zip(ids, chunk)),
+        )
+        db.executemany(
+            "INSERT INTO orders_fts (rowid, terms) VALUES (?, ?)",
+            ((i, fts_terms(order[0], order[1])) for i, order in zip(ids, chunk)),
+        )
+        next_id += len(chunk)
+    db.executescript(INDEXES)
+    db.execute("INSERT INTO orders_fts (orders_fts) VALUES ('optimize')")
+    db.commit()
+    db.execute("ANALYZE")
+    return db
+
+
+# ---------------------------------------------------------------------------
+# benchmark
+# ---------------------------------------------------------------------------
+
+
+def make_queries(db: sqlite3.Connection, n: int, seed: int = 1) -> list:
+    """
+    (user_email, item_name) the way people ask: mostly one word from an item
+    they did order, sometimes the full name, a typo, or something they didn't order
+    """
+    rng = random.Random(seed)
+    max_id = db.execute("SELECT max(id) FROM orders").fetchone()[0]
+    queries = []
+    for _ in range(n):
+        # a random order, so busy users are asked about as often as they order
+        row = db.execute("SELECT user_email, item_name FROM orders WHERE id = ?", (rng.randint(1, max_id),)).fetchone()
+        adjective, noun = row["item_name"].split()
+        kind = rng.random()
+        if kind < 0.6:
+            item = noun
+        elif kind < 0.8:
+            item = row["item_name"]
+        elif kind < 0.9:
+            i = rng.randrange(len(noun) - 1)
+            item = noun[:i] + noun[i + 1] + noun[i] + noun[i + 2:]  # swap two letters
+        else:
+            item = "umbrella"
+        queries.append((row["user_email"], item))
+    return queries
+
+
+def naive_search(db: sqlite3.Connection, user_email: str, item_name: str) -> list:
+    """
+    what you'd write first: a scan with LIKE, no indexes used
+    """
+    rows = db.execute(
+        "SELECT tracking_number, item_name, status, created_at FROM orders NOT INDEXED "
+        "WHERE user_email = ? AND item_name LIKE ? ORDER BY created_at DESC LIMIT ?",
+        (normalize_email(user_email), f"%{item_name}%", MAX_RESULTS),
+    ).fetchall()
+    return _rows(rows)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def time_queries(func, db, queries) -> list:
+    latencies = []
+    for user_email, item_name in queries:
+        start = time.perf_counter()
+        func(db, user_email, item_name)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench(sizes, n_queries: int, naive_limit: int, directory: str):
+    directory = directory or tempfile.mkdtemp(prefix="orders-bench-")
+    print(f"{'orders':>10}  {'build':>8}  {'size':>9}  {'indexed p50':>12}  {'p99':>9}  {'naive p50':>10}  {'p99':>9}")
+    for n in sizes:
+        path = os.path.join(directory, f"orders-{n}.db")
+        start = time.perf_counter()
+        db = build_db(path, n)
+        build_s = time.perf_counter() - start
+        size_mb = os.path.getsize(path) / 2**20
+
+        queries = make_queries(db, n_queries)
+        time_queries(search, db, queries[:50])  # warm the page cache
+        indexed = time_queries(search, db, queries)
+        naive = time_queries(naive_search, db, queries[:naive_limit]) if n <= 1_000_000 else None
+
+        naive_cols = (
+            f"{percentile(naive, 50) * 1000:>8.2f}ms  {percentile(naive, 99) * 1000:>7.2f}ms" if naive else f"{'-':>10}  {'-':>9}"
+        )
+        print(
+            f"{n:>10}  {build_s:>7.1f}s  {size_mb:>7.1f}MB  "
+            f"{percentile(indexed, 50) * 1000:>10.3f}ms  {percentile(indexed, 99) * 1000:>7.3f}ms  {naive_cols}"
+        )
+        db.close()
+        os.unlink(path)
+
+
+def run_conversation(db_path: str):
+    import openai
+
+    global db
+    db = connect(db_path)
+    if db.execute("SELECT count(*) FROM orders").fetchone()[0] == 0:
+        add_orders(db, generate_orders(1000))
+
+    client = openai.OpenAI()
+    tools = {"search_orders": search_orders}
+    messages = [
+        {"role": "system", "content": "you are a helpful assistant\n\nthe user your are assisting is: tom@acme-industries.com"},
+        {"role": "user", "content": "Did I ever order running shorts?"},
+    ]
+    schemas = [
+        {
+            "type": "function",
+            "function": {
+                "name": "search_orders",
+                "description": search_orders.__doc__.strip(),
+                "parameters": {
+                    "type": "object",
+                    "properties": {"user_email": {"type": "string"}, "item_name": {"type": "string"}},
+                    "required": ["user_email", "item_name"],
+                },
+            },
+        }
+    ]
+
+    print("\n\n------USER-----\n\n")
+    print(messages[-1]["content"])
+    while True:
+        resp = client.chat.completions.create(model="gpt-4o", messages=messages, tools=schemas)
+        messages.append(resp.choices[0].message.model_dump())
+        if not resp.choices[0].message.tool_calls:
+            print("\n\n------ASSISTANT-----\n\n")
+            print(resp.choices[0].message.content)
+            print("\n\n------USER-----\n\n> ", end="")
+            try:
+                user_input = input()
+            except EOFError:
+                print()
+                break
+            if user_input == "exit":
+                break
+            messages.append({"role": "user", "content": user_input})
+            continue
+
+        for tool_call in resp.choices[0].message.tool_calls:
+            func = tools.get(tool_call.function.name)
+            if func is None:
+                raise ValueError(f"Unknown tool call: {tool_call.function.name}")
+            print(f"\n\n------ASSISTANT (tools) -----\n\n{tool_call.function.name}({tool_call.function.arguments})")
+            messages.append(
+                {"role": "tool", "tool_call_id": tool_call.id, "content": func(**json.loads(tool_call.function.arguments))}
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="indexed search_orders over SQLite")
+    parser.add_argument("--db", default="orders.db")
+    sub = parser.add_subparsers(dest="command")
+
+    g = sub.add_parser("generate")
+    g.add_argument("--orders", type=int, default=1_000_000)
+    g.add_argument("--seed", type=int, default=0)
+
+    s = sub.add_parser("search")
+    s.add_argument("user_email")
+    s.add_argument("item_name")
+    s.add_argument("--limit", type=int, default=10)
+
+    b = sub.add_parser("bench")
+    b.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    b.add_argument("--queries", type=int, default=2000)
+    b.add_argument("--naive-queries", type=int, default=200, help="the unindexed scan is slow, run fewer")
+    b.add_argument("--dir", help="where to build the databases, defaults to a temp dir")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        start = time.perf_counter()
+        build_db(args.db, args.orders, args.seed).close()
+        print(f"{args.orders} orders in {args.db} ({time.perf_counter() - start:.1f}s)")
+    elif args.command == "search":
+        start = time.perf_counter()
+        results = search(connect(args.db), args.user_email, args.item_name, args.limit)
+        print(json.dumps(results, indent=2))
+        print(f"{len(results)} results in {(time.perf_counter() - start) * 1000:.2f}ms")
+    elif args.command == "bench":
+        bench(args.sizes, args.queries, args.naive_queries, args.dir)
+    else:
+        run_conversation(args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+inject secure per-session parameters (user email, db connection strings) into tools at dispatch time
+
+The model never sees `user_email` or `db_url`: they're left out of the schema we
+send, and filled in from the session when the tool actually runs. If the model
+tries to pass them anyway, the call is rejected.
+
+The usual way to do this is a closure per session:
+
+    def make_search_orders(user_email):
+        def search_orders(item_name: str): ...
+        return search_orders
+
+which works, but every session then builds its own functions and its own
+schemas. Here the tool table is compiled once, and a session is just a dict of
+the values to inject, so 10k concurrent sessions share one table.
+
+    python 01-injected-tool-params.py          # chat as tom@acme-industries.com
+    python 01-injected-tool-params.py bench    # memory + dispatch cost per session vs closures
+"""
+
+import argparse
+import inspect
+import json
+from datetime import datetime, timedelta
+from random import randint
+
+
+def function_to_schema(func, exclude=()) -> dict:
+    type_map = {
+        str: "string",
+        int: "integer",
+        float: "number",
+        bool: "boolean",
+        list: "array",
+        dict: "object",
+        type(None): "null",
+    }
+
+    try:
+        signature = inspect.signature(func)
+    except ValueError as e:
+        raise ValueError(
+            f"Failed to get signature for function {func.__name__}: {str(e)}"
+        )
+
+    # injected parameters are ours to fill in, the model shouldn't know they exist
+    params = [p for p in signature.parameters.values() if p.name not in exclude]
+
+    parameters = {}
+    for param in params:
+        parameters[param.name] = {"type": type_map.get(param.annotation, "string")}
+
+    required = [param.name for param in params if param.default == inspect._empty]
+
+    return {
+        "type": "function",
+        "function": {
+            "name": func.__name__,
+            "description": (func.__doc__ or "").strip(),
+            "parameters": {
+                "type": "object",
+                "properties": parameters,
+                "required": required,
+            },
+        },
+    }
+
+
+class Tool:
+    __slots__ = ("func", "schema", "injected", "visible")
+
+    def __init__(self, func, inject):
+        # inject is a list of parameter names, or {parameter: session key}
+        if not isinstance(inject, dict):
+            inject = {name: name for name in inject}
+        params = inspect.signature(func).parameters
+        missing = [name for name in inject if name not in params]
+        if missing:
+            raise ValueError(f"{func.__name__} has no parameters named {missing}")
+        self.func = func
+        self.schema = function_to_schema(func, exclude=inject)
+        # (parameter, session key) pairs, the cheapest thing to loop over per call
+        self.injected = tuple(inject.items())
+        self.visible = frozenset(params) - frozenset(inject)
+
+
+class ToolRegistry:
+    """
+    tools are compiled once, when they're registered. per-session state is
+    passed to dispatch() rather than baked into the tools.
+    """
+
+    def __init__(self):
+        self._tools = {}
+        self.schemas = []
+
+    def register(self, func, inject=()):
+        tool = Tool(func, inject)
+        self._tools[func.__name__] = tool
+        self.schemas.append(tool.schema)
+        return func
+
+    def dispatch(self, session: dict, name: str, arguments: str):
+        tool = self._tools.get(name)
+        if tool is None:
+            raise ValueError(f"Unknown tool call: {name}")
+
+        kwargs = json.loads(arguments)
+        if type(kwargs) is not dict:
+            raise ValueError(f"{name} arguments must be a JSON object")
+        if not tool.visible.issuperset(kwargs):
+            # this is the deterministic guardrail: even if a prompt injection
+            # convinces the model to pass user_email, it doesn't get used
+            unexpected = sorted(kwargs.keys() - tool.visible)
+            raise PermissionError(f"{name} was called with parameters it can't set: {unexpected}")
+
+        for param, key in tool.injected:
+            kwargs[param] = session[key]
+        return tool.func(**kwargs)
+
+
+tools = ToolRegistry()
+
+# pretend this is a table in the orders database at db_url
+ORDERS = {
+    "tom@acme-industries.com": [
+        {"tracking_number": "8675309", "item_name": "running shorts"},
+        {"tracking_number": "1234567", "item_name": "hoodie"},
+    ],
+    "jane@acme-industries.com": [
+        {"tracking_number": "7654321", "item_name": "board shorts"},
+    ],
+}
+
+
+def search_orders(user_email: str, item_name: str, db_url: str) -> list:
+    """
+    search the current user's orders by item name, returns matching orders with tracking numbers
+    """
+    # in reality, we'd connect to db_url here
+    #
+    #   db = sqlite3.connect(db_url)
+    #   db.execute("select ... where user_email = ? and item_name like ?", ...)
+    #
+    return [
+        order
+        for order in ORDERS.get(user_email, [])
+        if item_name.lower() in order["item_name"].lower()
+    ]
+
+
+def get_estimated_delivery_date(tracking_number: str) -> str:
+    """
+    get the estimated delivery date for a package
+    """
+    return (datetime.now() + timedelta(days=randint(1, 14))).isoformat()
+
+
+tools.register(search_orders, inject=["user_email", "db_url"])
+tools.register(get_estimated_delivery_date)
+
+
+def run_conversation(session: dict):
+    import openai
+
+    client = openai.OpenAI()
+
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": "Where is my shorts delivery?"},
+    ]
+
+    print("\n\n------TOOLS-----\n\n")
+    print(json.dumps(tools.schemas, indent=2))
+
+    print("\n\n------USER-----\n\n")
+    print(json.dumps(messages[-1]["content"], indent=2))
+
+    while True:
+        resp = client.chat.completions.create(
+            model="gpt-4o",
+            messages=messages,
+            tools=tools.schemas,
+        )
+        messages.append(resp.choices[0].message.model_dump())
+
+        if not resp.choices[0].message.tool_calls:
+            print("\n\n------ASSISTANT-----\n\n")
+            print(json.dumps(messages[-1]["content"], indent=2))
+            print("\n\n------USER-----\n\n> ", end="")
+            try:
+                user_input = input()
+                if user_input == "exit":
+                    break
+                messages.append({"role": "user", "content": user_input})
+            except EOFError:
+                print()
+                break
+            continue
+
+        for tool_call in resp.choices[0].message.tool_calls:
+            print("\n\n------ASSISTANT (tools) -----\n\n")
+            print(f"{tool_call.function.name}({tool_call.function.arguments})")
+            try:
+                result = tools.dispatch(session, tool_call.function.name, tool_call.function.arguments)
+            except (PermissionError, TypeError, ValueError) as e:
+                # bad JSON, a missing argument, a wrong one: tell the model and
+                # let it try again rather than ending the conversation
+                result = f"error: {e}"
+            print(f"\n=> {result}")
+            messages.append(
+                {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": json.dumps(result),
+                }
+            )
+
+
+# ---------------------------------------------------------------------------
+# benchmark: one compiled table + a dict per session, vs closures per session
+# ---------------------------------------------------------------------------
+
+
+def make_closure_tools(user_email: str, db_url: str):
+    def search_orders(item_name: str) -> list:
+        """
+        search the current user's orders by item name, returns matching orders with tracking numbers
+        """
+        return [
+            order
+            for order in ORDERS.get(user_email, [])
+            if item_name.lower() in order["item_name"].lower()
+        ]
+
+    table = {
+        "search_orders": search_orders,
+        "get_estimated_delivery_date": get_estimated_delivery_date,
+    }
+    schemas = [function_to_schema(f) for f in table.values()]
+    return table, schemas
+
+
+def closure_dispatch(table, name, arguments):
+    return table[name](**json.loads(arguments))
+
+
+def bench(sessions: int, calls: int, repeats: int):
+    import time
+    import tracemalloc
+
+    emails = list(ORDERS)
+    arguments = json.dumps({"item_name": "shorts"})
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    registry_sessions = [
+        {"user_email": emails[i % len(emails)], "db_url": f"sqlite:///orders-{i % 4}.db"}
+        for i in range(sessions)
+    ]
+    registry_bytes = tracemalloc.get_traced_memory()[0] - before
+
+    before = tracemalloc.get_traced_memory()[0]
+    closure_sessions = [
+        make_closure_tools(emails[i % len(emails)], f"sqlite:///orders-{i % 4}.db")
+        for i in range(sessions)
+    ]
+    closure_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    def registry_run():
+        for i in range(calls):
+            tools.dispatch(registry_sessions[i % sessions], "search_orders", arguments)
+
+    def closure_run():
+        for i in range(calls):
+            closure_dispatch(closure_sessions[i % sessions][0], "search_orders", arguments)
+
+    # best of a few interleaved runs, single runs are noisy at this scale
+    timings = {registry_run: [], closure_run: []}
+    for _ in range(repeats):
+        for run, times in timings.items():
+            start = time.perf_counter()
+            run()
+            times.append((time.perf_counter() - start) / calls)
+    registry_dispatch = min(timings[registry_run])
+    closure_dispatch_time = min(timings[closure_run])
+
+    print(f"{sessions:,} sessions, {calls:,} dispatches, best of {repeats}\n")
+    print(f"{'':>18}  {'bytes/session':>14}  {'dispatch':>10}")
+    print(f"{'compiled registry':>18}  {registry_bytes / sessions:14.0f}  {registry_dispatch * 1e6:8.2f}us")
+    print(f"{'closures':>18}  {closure_bytes / sessions:14.0f}  {closure_dispatch_time * 1e6:8.2f}us")
+    print(
+        f"\nthe registry costs {(registry_dispatch - closure_dispatch_time) * 1e6:+.2f}us "
+        f"({registry_dispatch / closure_dispatch_time - 1:+.0%}) per dispatch and saves "
+        f"{(closure_bytes - registry_bytes) / sessions:,.0f} bytes per session"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="inject per-session tool parameters")
+    sub = parser.add_subparsers(dest="command")
+    b = sub.add_parser("bench")
+    b.add_argument("--sessions", type=int, default=10_000)
+    b.add_argument("--calls", type=int, default=200_000)
+    b.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.sessions, args.calls, args.repeats)
+    else:
+        run_conversation(
+            {"user_email": "tom@acme-industries.com", "db_url": "sqlite:///orders.db"}
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+replay recorded tool-calling sessions against the stub server and track client-side cost per turn
+
+    python scripts/bench_sessions.py run                        # print the numbers
+    python scripts/bench_sessions.py record                     # save scripts/baselines/<git rev>.json
+    python scripts/bench_sessions.py compare                    # run now, compare with the newest baseline
+    python scripts/bench_sessions.py compare old.json new.json --threshold 0.05
+
+Each entry in 03-intro-to-tool-calling/solutions/recorded-sessions.json (the
+same recordings 12-model-routing and 13-speculative-prefetch replay) is a
+conversation recorded from one of the ch03 loops: the starting messages, what
+the user typed, and the chat completions the model sent back. replay_session()
+below takes the same steps as the loop in 05-exercise-parallel-tool-calls (run
+every tool call, feed the results back, ask the user when the model answers in
+text), driven while scripts/llm_stub_server.py plays back the recorded
+completions.
+
+It's a stand-in for that loop, not the loop itself: the solution files call
+input() and run when they're imported, so they can't be driven from here. What
+this tracks is the client side of any loop shaped like it: the openai SDK,
+httpx, and how the history grows. Editing a solution file won't show up here
+unless the same change is made to replay_session().
+
+Per session we measure:
+
+- bytes_per_request     request body size, which grows as the history does
+- retained_blocks       allocated blocks still alive afterwards
+- overhead_ms_per_turn  time in create() that wasn't spent in the server
+- peak_kib              tracemalloc peak while replaying the session
+
+The first two don't depend on how busy the machine is, so those are the ones
+`compare` checks: it exits 1 if either got worse than the baseline by more than
+--threshold (as a fraction). The timing and peak memory move by 30% or more
+between runs on the same machine, so they're printed for reference but never
+fail the comparison. The newest baseline is the one with the latest
+recorded_at.
+"""
+
+import argparse
+import gc
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from statistics import median
+
+import httpx
+import openai
+
+import llm_stub_server
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SESSIONS_PATH = os.path.join(
+    SCRIPTS_DIR, "..", "intro--genai-the-good-parts", "03-intro-to-tool-calling", "solutions", "recorded-sessions.json"
+)
+BASELINES_DIR = os.path.join(SCRIPTS_DIR, "baselines")
+FORMAT_VERSION = 2
+
+# compare fails on these, if they grow by more than this and --threshold
+GATED = {
+    "bytes_per_request": 16,
+    "retained_blocks": 50,
+}
+# and only prints these, they're too noisy to fail on
+REPORTED = ["overhead_ms_per_turn", "peak_kib"]
+
+
+def get_estimated_delivery_date(tracking_number: str) -> str:
+    """
+    get the estimated delivery date for a package
+    """
+    # deterministic, so replays always send the same bytes
+    days = zlib.crc32(tracking_number.encode()) % 14 + 1
+    return (date(2024, 5, 1) + timedelta(days=days)).isoformat()
+
+
+openai_functions = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_estimated_delivery_date",
+            "description": "get the estimated delivery date for a package",
+            "parameters": {
+                "type": "object",
+                "properties": {"tracking_number": {"type": "string"}},
+                "required": ["tracking_number"],
+            },
+        },
+    }
+]
+
+
+def load_sessions() -> list:
+    with open(SESSIONS_PATH) as f:
+        return json.load(f)
+
+
+def replay_session(client, session: dict, turns: list):
+    """
+    the steps of the loop in 05-exercise-parallel-tool-calls, with user input
+    coming from the recording. appends (client overhead seconds, server seconds) per turn.
+    """
+    messages = [dict(m) for m in session["messages"]]
+    user_inputs = iter(session["user_inputs"])
+
+    while True:
+        start = time.perf_counter()
+        raw = client.chat.completions.with_raw_response.create(
+            model="gpt-4o",
+            messages=messages,
+            tools=openai_functions,
+        )
+        resp = raw.parse()
+        elapsed = time.perf_counter() - start
+        server = float(raw.headers.get("x-stub-server-ms", 0)) / 1000
+        turns.append((elapsed - server, server))
+
+        messages.append(resp.choices[0].message.model_dump())
+
+        if not resp.choices[0].message.tool_calls:
+            user_input = next(user_inputs, None)
+            if user_input is None:
+                return messages
+            messages.append({"role": "user", "content": user_input})
+            continue
+
+        for tool_call in resp.choices[0].message.tool_calls:
+            if tool_call.function.name == "get_estimated_delivery_date":
+                args = json.loads(tool_call.function.arguments)
+                messages.append(
+                    {
+                        "role": "tool",
+                        "tool_call_id": tool_call.id,
+                        "content": get_estimated_delivery_date(args["tracking_number"]),
+                    }
+                )
+            else:
+                raise ValueError(f"Unknown tool call: {tool_call.function.name}")
+
+
+def measure(session: dict, server, client, request_sizes: list, repeats: int) -> dict:
+    # timing runs, without tracemalloc slowing everything down
+    overheads = []
+    for _ in range(repeats):
+        server.replay.extend(session["responses"])
+        turns = []
+        request_sizes.clear()
+        replay_session(client, session, turns)
+        overheads.append(sum(o for o, _ in turns) / len(turns))
+    sizes = list(request_sizes)
+
+    # one more run for peak memory
+    server.replay.extend(session["responses"])
+    gc.collect()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    replay_session(client, session, [])
+    peak = tracemalloc.get_traced_memory()[1] - start_bytes
+    tracemalloc.stop()
+
+    # and a few for what's left behind. a leak leaves blocks every run, while
+    # caches filling and the stub server's thread only do sometimes, so the
+    # smallest count is the one to go by
+    retained = []
+    for _ in range(3):
+        server.replay.extend(session["responses"])
+        gc.collect()
+        blocks_before = sys.getallocatedblocks()
+        replay_session(client, session, [])
+        gc.collect()
+        retained.append(sys.getallocatedblocks() - blocks_before)
+
+    if server.replay:
+        raise RuntimeError(f"{session['name']}: {len(server.replay)} recorded responses were never requested")
+
+    return {
+        "turns": len(session["responses"]),
+        "overhead_ms_per_turn": round(median(overheads) * 1000, 3),
+        "bytes_per_request": round(sum(sizes) / len(sizes)),
+        "bytes_total": sum(sizes),
+        "peak_kib": round(peak / 1024, 1),
+        "retained_blocks": max(min(retained), 0),
+    }
+
+
+def run(repeats: int) -> dict:
+    server = llm_stub_server.start()
+    request_sizes = []
+
+    def record_size(request):
+        request_sizes.append(len(request.content))
+
+    client = openai.OpenAI(
+        api_key="stub",
+        base_url=llm_stub_server.client_env(server)["OPENAI_BASE_URL"],
+        http_client=httpx.Client(event_hooks={"request": [record_size]}),
+    )
+
+    # warm up imports, the connection and pydantic's caches
+    warmup = load_sessions()[0]
+    server.replay.extend(warmup["responses"])
+    replay_session(client, warmup, [])
+
+    results = {}
+    for session in load_sessions():
+        results[session["name"]] = measure(session, server, client, request_sizes, repeats)
+    server.shutdown()
+
+    return {
+        "format_version": FORMAT_VERSION,
+        "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_rev": git_rev(),
+        "python": platform.python_version(),
+        "openai": openai.__version__,
+        "machine": platform.node(),
+        "sessions": results,
+    }
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=SCRIPTS_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results: dict):
+    metrics = list(GATED) + REPORTED
+    print(f"{'session':<18}" + "".join(f"{m:>22}" for m in metrics))
+    for name, values in results["sessions"].items():
+        print(f"{name:<18}" + "".join(f"{values[m]:>22}" for m in metrics))
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    if baseline.get("format_version") != current.get("format_version"):
+        raise SystemExit("baseline was recorded with a different format_version, re-record it")
+    for key in ("python", "openai"):
+        if baseline.get(key) != current.get(key):
+            print(
+                f"note: baseline used {key} {baseline.get(key)}, this is {current.get(key)}. "
+                "request sizes and allocations may differ for reasons that aren't the code, "
+                "`make bench-record` a local baseline\n"
+            )
+
+    regressions = []
+    print(f"{'session':<18}{'metric':<24}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, values in current["sessions"].items():
+        old_values = baseline["sessions"].get(name)
+        if old_values is None:
+            print(f"{name:<18}(new session, no baseline)")
+            continue
+        for metric in list(GATED) + REPORTED:
+            old, new = old_values[metric], values[metric]
+            change = (new - old) / old if old else 0.0
+            flag = ""
+            if metric not in GATED:
+                flag = "  (not checked)"
+            elif new - old > GATED[metric] and change > threshold:
+                flag = "  REGRESSION"
+                regressions.append((name, metric, old, new))
+            print(f"{name:<18}{metric:<24}{old:>12}{new:>12}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def newest_baseline() -> str:
+    # by the recorded timestamp, not mtime: a checkout or copy resets mtimes
+    baselines = []
+    for path in glob.glob(os.path.join(BASELINES_DIR, "*.json")):
+        with open(path) as f:
+            baselines.append((json.load(f).get("recorded_at", ""), path))
+    if not baselines:
+        raise SystemExit(f"no baselines in {BASELINES_DIR}, run `record` first")
+    return max(baselines)[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="recorded-session performance benchmarks")
+    parser.add_argument("--repeats", type=int, default=20)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("run")
+
+    record = sub.add_parser("record")
+    record.add_argument("--out", help="defaults to scripts/baselines/<git rev>.json")
+
+    cmp = sub.add_parser("compare")
+    cmp.add_argument("baseline", nargs="?", help="defaults to the newest recorded_at in scripts/baselines")
+    cmp.add_argument("current", nargs="?", help="defaults to running the benchmark now")
+    cmp.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        print_results(run(args.repeats))
+    elif args.command == "record":
+        results = run(args.repeats)
+        out = args.out or os.path.join(BASELINES_DIR, f"{results['git_rev']}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+        with open(out, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print_results(results)
+        print(f"\nwrote {out}")
+    else:
+        with open(args.baseline or newest_baseline()) as f:
+            baseline = json.load(f)
+        if args.current:
+            with open(args.current) as f:
+                current = json.load(f)
+        else:
+            current = run(args.repeats)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed by more than {args.threshold:.0%}")
+            return 1
+        print("\nno regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+a local stand-in for the OpenAI and Anthropic APIs, for running the examples without real model calls
+
+    python scripts/llm_stub_server.py --port 8765
+
+    export OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub
+    export ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=stub
+
+Responses are deterministic and shaped like the real thing:
+
+- chat completions (streaming or not) answer with a haiku
+- if tools are offered and the last message is from the user, the first tool is
+  called, with a placeholder for every required argument
+- if a json_schema response_format is given, the answer is a JSON object that
+  matches the schema
+- anthropic messages (streaming or not) answer with the same haiku
+
+To replay a recorded session instead, push its recorded chat completions onto
+`server.replay` (a deque) and they're served in order, ahead of the canned ones.
+Every JSON response carries an `x-stub-server-ms` header with how long the
+server spent on it, so clients can subtract it out when timing themselves.
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HAIKU = "Code calls on itself,\nFunction within a function—\nInfinite echoes."
+
+PLACEHOLDERS = {
+    "string": "8675309",
+    "integer": 7,
+    "number": 7.0,
+    "boolean": True,
+    "array": [],
+    "object": {},
+    "null": None,
+}
+
+
+def placeholder_for(schema: dict) -> dict:
+    properties = schema.get("properties", {})
+    values = {}
+    for name, prop in properties.items():
+        if name not in schema.get("required", properties):
+            continue
+        if prop.get("type") == "string" and "date" in name:
+            values[name] = "2024-05-01"
+        else:
+            values[name] = PLACEHOLDERS.get(prop.get("type"), "8675309")
+    return values
+
+
+def chat_completion(body: dict) -> dict:
+    messages = body.get("messages", [])
+    last_role = messages[-1]["role"] if messages else "user"
+    message = {"role": "assistant", "content": HAIKU}
+    finish_reason = "stop"
+
+    if body.get("tools") and last_role == "user":
+        function = body["tools"][0]["function"]
+        message = {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": f"call_stub_{len(messages)}",
+                    "type": "function",
+                    "function": {
+                        "name": function["name"],
+                        "arguments": json.dumps(placeholder_for(function.get("parameters", {}))),
+                    },
+                }
+            ],
+        }
+        finish_reason = "tool_calls"
+    elif (body.get("response_format") or {}).get("type") == "json_schema":
+        schema = body["response_format"]["json_schema"]["schema"]
+        message["content"] = json.dumps(placeholder_for(schema))
+
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": 0,
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+    }
+
+
+def chat_completion_chunks(body: dict):
+    completion = chat_completion(body)
+    message = completion["choices"][0]["message"]
+    base = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": 0, "model": completion["model"]}
+
+    if message.get("tool_calls"):
+        deltas = [{"role": "assistant", "tool_calls": [{"index": 0, **message["tool_calls"][0]}]}]
+    else:
+        deltas = [{"role": "assistant", "content": ""}]
+        deltas += [{"content": word + " "} for word in message["content"].split(" ")]
+
+    for delta in deltas:
+        yield {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+    yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": completion["choices"][0]["finish_reason"]}]}
+
+
+def anthropic_message(body: dict) -> dict:
+    return {
+        "id": "msg_stub",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "claude-3-haiku-20240307"),
+        "content": [{"type": "text", "text": HAIKU}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": 10, "output_tokens": 10},
+    }
+
+
+def anthropic_events(body: dict):
+    message = anthropic_message(body)
+    yield "message_start", {"type": "message_start", "message": {**message, "content": []}}
+    yield "content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}
+    for word in HAIKU.split(" "):
+        yield "content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word + " "}}
+    yield "content_block_stop", {"type": "content_block_stop", "index": 0}
+    yield "message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": 10}}
+    yield "message_stop", {"type": "message_stop"}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out as separate writes, without this every keep-alive
+    # response waits on the client's delayed ACK (~40ms)
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.started = time.perf_counter()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = self.path.split("?")[0].rstrip("/")
+
+        if path.endswith("/chat/completions"):
+            if self.server.replay and not body.get("stream"):
+                self.send_json(self.server.replay.popleft())
+            elif body.get("stream"):
+                self.send_events((None, chunk) for chunk in chat_completion_chunks(body))
+                self.wfile.write(b"data: [DONE]\n\n")
+            else:
+                self.send_json(chat_completion(body))
+        elif path.endswith("/messages"):
+            if body.get("stream"):
+                self.send_events(anthropic_events(body))
+            else:
+                self.send_json(anthropic_message(body))
+        else:
+            self.send_json({"error": {"message": f"stub server doesn't know {path}"}}, status=404)
+
+    def send_json(self, payload: dict, status: int = 200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("x-stub-server-ms", f"{(time.perf_counter() - self.started) * 1000:.3f}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_events(self, events):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for event, payload in events:
+            if event:
+                self.wfile.write(f"event: {event}\n".encode())
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+def start(port: int = 0) -> ThreadingHTTPServer:
+    """
+    start the server on a background thread, port 0 picks a free port
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.replay = deque()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def client_env(server: ThreadingHTTPServer) -> dict:
+    """
+    the environment variables that point both SDKs at `server`
+    """
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    return {
+        "OPENAI_BASE_URL": base_url + "/v1",
+        "OPENAI_API_KEY": "stub",
+        "ANTHROPIC_BASE_URL": base_url,
+        "ANTHROPIC_API_KEY": "stub",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="local stand-in for the OpenAI and Anthropic APIs")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    server.replay = deque()
+    for name, value in client_env(server).items():
+        print(f"export {name}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
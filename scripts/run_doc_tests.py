@@ -0,0 +1,224 @@
+"""
+run the python blocks in the chapter READMEs in parallel, against a local stand-in LLM server
+
+    python scripts/run_doc_tests.py                       # every chapter README
+    python scripts/run_doc_tests.py path/to/README.md     # just one
+    python scripts/run_doc_tests.py --no-cache -j 16
+
+`make test` runs `pytest --markdown-docs`, which executes every ```python block
+one after another and makes a real model call for each. This runner follows
+the same fence rules (`python notest` is skipped, `python continuation` runs
+after the block before it) but:
+
+- runs each block in its own process, several at a time
+- points OPENAI_BASE_URL / ANTHROPIC_BASE_URL at scripts/llm_stub_server.py
+- caches passing blocks, keyed on the block's source plus any solutions/*.py
+  files linked from the same README section (and this runner and the stub
+  server themselves), so unchanged blocks are skipped
+- prints how long each block took, slowest first
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_stub_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_PATH = os.path.join(REPO_ROOT, ".doctest-cache.json")
+DEFAULT_READMES = os.path.join(REPO_ROOT, "intro--genai-the-good-parts", "*", "README.md")
+
+fence_re = re.compile(r"^```(\S*)(.*)$")
+heading_re = re.compile(r"^#{1,6} ")
+solution_link_re = re.compile(r"""[("'](\.?/?solutions/[^)"']+\.py)[)"']""")
+
+
+def _harness_digest() -> bytes:
+    # a change to how blocks are run, or to what the stub server answers,
+    # can change whether a block passes, so it invalidates every cached result
+    digest = hashlib.sha256()
+    for path in (os.path.abspath(__file__), os.path.abspath(llm_stub_server.__file__)):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.digest()
+
+
+HARNESS_DIGEST = _harness_digest()
+
+
+class Block:
+    def __init__(self, readme, line, source, options, section_links):
+        self.readme = readme
+        self.line = line
+        self.source = source
+        self.options = options
+        self.section_links = section_links
+
+    @property
+    def name(self):
+        return f"{os.path.relpath(self.readme, REPO_ROOT)}:{self.line}"
+
+    def cache_key(self) -> str:
+        digest = hashlib.sha256(HARNESS_DIGEST)
+        digest.update(self.source.encode())
+        directory = os.path.dirname(self.readme)
+        for link in sorted(self.section_links):
+            path = os.path.normpath(os.path.join(directory, link))
+            digest.update(link.encode())
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+        return digest.hexdigest()
+
+
+def extract_blocks(readme: str) -> list:
+    with open(readme) as f:
+        lines = f.read().splitlines()
+
+    # split into sections on headings so a block can be tied to the solution
+    # files its section links to
+    section_starts = [i for i, line in enumerate(lines) if heading_re.match(line)] + [len(lines)]
+
+    def section_links(index):
+        start = max([s for s in section_starts if s <= index], default=0)
+        end = min(s for s in section_starts if s > index)
+        return set(solution_link_re.findall("\n".join(lines[start:end])))
+
+    blocks = []
+    previous_source = ""
+    i = 0
+    while i < len(lines):
+        match = fence_re.match(lines[i])
+        if not match:
+            i += 1
+            continue
+
+        language, options = match.group(1), match.group(2).split()
+        start = i
+        i += 1
+        body = []
+        while i < len(lines) and not lines[i].startswith("```"):
+            body.append(lines[i])
+            i += 1
+        i += 1
+
+        if language != "python":
+            continue
+        source = "\n".join(body) + "\n"
+        if "continuation" in options:
+            source = previous_source + source
+        previous_source = source
+        if "notest" in options:
+            continue
+        blocks.append(Block(readme, start + 1, source, options, section_links(start)))
+
+    return blocks
+
+
+def run_block(block: Block, env: dict, timeout: float) -> dict:
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+        f.write(block.source)
+        path = f.name
+
+    start = time.perf_counter()
+    try:
+        proc = subprocess.run(
+            [sys.executable, path],
+            cwd=os.path.dirname(block.readme),
+            env=env,
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+        status = "passed" if proc.returncode == 0 else "failed"
+        output = proc.stdout + proc.stderr
+    except subprocess.TimeoutExpired as e:
+        status = "failed"
+        output = f"timed out after {timeout}s\n{e.stdout or ''}{e.stderr or ''}"
+    finally:
+        os.unlink(path)
+
+    return {"status": status, "seconds": time.perf_counter() - start, "output": output}
+
+
+def load_cache() -> dict:
+    try:
+        with open(CACHE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache: dict):
+    with open(CACHE_PATH, "w") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="parallel, cached README code block runner")
+    parser.add_argument("readmes", nargs="*", help=f"defaults to {os.path.relpath(DEFAULT_READMES, REPO_ROOT)}")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds per block")
+    parser.add_argument("--slow", type=float, default=2.0, help="flag blocks slower than this many seconds")
+    parser.add_argument("--no-cache", action="store_true", help="run every block, even unchanged ones")
+    parser.add_argument("--real-api", action="store_true", help="don't route calls to the stub server")
+    args = parser.parse_args()
+
+    readmes = args.readmes or sorted(glob.glob(DEFAULT_READMES))
+    blocks = [block for readme in readmes for block in extract_blocks(os.path.abspath(readme))]
+
+    env = dict(os.environ)
+    server = None
+    if not args.real_api:
+        server = llm_stub_server.start()
+        env.update(llm_stub_server.client_env(server))
+
+    cache = {} if args.no_cache else load_cache()
+    results = {}
+    to_run = []
+    for block in blocks:
+        cached = cache.get(block.cache_key())
+        if cached:
+            results[block.name] = {**cached, "status": "cached", "output": ""}
+        else:
+            to_run.append(block)
+
+    print(f"{len(blocks)} blocks, {len(blocks) - len(to_run)} cached, running {len(to_run)} with {args.jobs} workers")
+    with ThreadPoolExecutor(args.jobs) as pool:
+        # each block is its own python process, the threads just wait on them
+        futures = {block: pool.submit(run_block, block, env, args.timeout) for block in to_run}
+        for block, future in futures.items():
+            result = future.result()
+            results[block.name] = result
+            if result["status"] == "passed" and not args.real_api:
+                cache[block.cache_key()] = {"seconds": result["seconds"]}
+
+    if server is not None:
+        server.shutdown()
+    if not args.no_cache:
+        save_cache(cache)
+
+    print()
+    for name, result in sorted(results.items(), key=lambda item: -item[1]["seconds"]):
+        slow = "  <-- slow" if result["seconds"] > args.slow and result["status"] != "cached" else ""
+        print(f"{result['status']:>7}  {result['seconds']:6.2f}s  {name}{slow}")
+
+    failed = [name for name, result in results.items() if result["status"] == "failed"]
+    for name in failed:
+        print(f"\n------{name}------\n{results[name]['output']}")
+
+    print(f"\n{len(failed)} failed, {len(results) - len(failed)} passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())